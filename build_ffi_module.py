@@ -11,7 +11,9 @@ Software license: "MIT software license". See http://opensource.org/licenses/MIT
 
 
 import os
+import sys
 import platform
+import sysconfig
 from cffi import FFI
 
 miniaudio_include_dir = os.getcwd()
@@ -770,12 +772,37 @@ typedef ma_bool32 (* ma_enum_devices_callback_proc)(ma_context* pContext, ma_dev
     void ma_free(void* p, const ma_allocation_callbacks* pAllocationCallbacks);
 
     void init_miniaudio(void);
+    void pyma_interleave_stereo_f32(const float* left, const float* right, float* output, size_t frameCount);
+    void pyma_interleave_stereo_s16(const int16_t* left, const int16_t* right, int16_t* output, size_t frameCount);
+    void pyma_deinterleave_stereo_f32(const float* input, float* left, float* right, size_t frameCount);
+    void pyma_deinterleave_stereo_s16(const int16_t* input, int16_t* left, int16_t* right, size_t frameCount);
+    void pyma_s16_to_f32(float* output, const int16_t* input, size_t count);
+    void pyma_f32_to_s16(int16_t* output, const float* input, size_t count);
+    void pyma_s16_to_u8(ma_uint8* output, const int16_t* input, size_t count);
+    void pyma_f32_to_s16_dither(int16_t* output, const float* input, size_t count, ma_dither_mode ditherMode, ma_uint32* pState);
+    void pyma_levels_f32(const float* samples, size_t count, float* peak, double* sumsquares);
+    void pyma_levels_s16(const int16_t* samples, size_t count, int32_t* peak, int64_t* sumsquares);
+    void pyma_flush_denormals(void);
+    typedef struct pyma_prefetch pyma_prefetch;
+    pyma_prefetch* pyma_prefetch_init(ma_format format, ma_uint32 channels, ma_uint32 bufferSizeInFrames, void* pUserData);
+    void pyma_prefetch_uninit(pyma_prefetch* pPrefetch);
+    void pyma_prefetch_reset(pyma_prefetch* pPrefetch);
+    void* pyma_prefetch_get_userdata(pyma_prefetch* pPrefetch);
+    ma_uint32 pyma_prefetch_available_read(pyma_prefetch* pPrefetch);
+    ma_uint32 pyma_prefetch_available_write(pyma_prefetch* pPrefetch);
+    ma_uint32 pyma_prefetch_write(pyma_prefetch* pPrefetch, const void* pFrames, ma_uint32 frameCount);
+    void pyma_prefetch_data_callback(ma_device* pDevice, void* pOutput, const void* pInput, ma_uint32 frameCount);
+    void pyma_passthrough_data_callback(ma_device* pDevice, void* pOutput, const void* pInput, ma_uint32 frameCount);
+    ma_uint64 pyma_resample_f32(const float* pIn, ma_uint64 inFrames, ma_uint32 channels, float* pOut, ma_uint64 outFrames, double step, ma_bool32 hermite);
+    ma_uint64 pyma_decoder_read(ma_decoder* pDecoder, void* pFramesOut, ma_uint64 frameCount, ma_bool32 loop);
+    ma_uint64 pyma_decoder_read_planar(ma_decoder* pDecoder, void** ppPlanes, ma_uint64 frameCount);
     void *malloc(size_t size);
     void free(void *ptr);
 
     /**** callbacks ****/
     extern "Python" void _internal_data_callback(ma_device* pDevice, void* pOutput, const void* pInput, ma_uint32 frameCount);
     extern "Python" void _internal_stop_callback(ma_device* pDevice);
+    extern "Python" void _internal_prefetch_stop_callback(ma_device* pDevice);
     
     /* decoder read and seek callbacks */
     extern "Python" size_t _internal_decoder_read_callback(ma_decoder* pDecoder, void* pBufferOut, size_t bytesToRead);
@@ -789,11 +816,72 @@ ffibuilder = FFI()
 ffibuilder.cdef(vorbis_defs + miniaudio_defs)
 
 
+# Set PYMINIAUDIO_ARCH=baseline to build a module that runs on any cpu of the target architecture
+# (use this for binary wheels that are distributed). The default is to optimize for the build machine.
+# PYMINIAUDIO_ARCH=avx2 builds for any x86-64 cpu with AVX2 and FMA (Intel Haswell/AMD Excavator and newer).
+target_arch = os.environ.get("PYMINIAUDIO_ARCH", "native")
+if target_arch not in ("native", "baseline", "avx2"):
+    raise ValueError("invalid PYMINIAUDIO_ARCH, expected 'native', 'baseline' or 'avx2'", target_arch)
+if target_arch == "avx2" and platform.machine().lower() not in ("x86_64", "amd64"):
+    raise ValueError("PYMINIAUDIO_ARCH=avx2 is only possible on x86-64")
+
+# Set PYMINIAUDIO_PGO=generate to build an instrumented module, run a training workload with it
+# (see pgo_training.py) and then rebuild with PYMINIAUDIO_PGO=use to optimize using that profile data.
+pgo_mode = os.environ.get("PYMINIAUDIO_PGO", "")
+if pgo_mode not in ("", "generate", "use"):
+    raise ValueError("invalid PYMINIAUDIO_PGO, expected 'generate' or 'use'", pgo_mode)
+pgo_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "pgo")
+
 libraries = []
 compiler_args = []
+linker_args = []
 if os.name == "posix":
     libraries = ["m", "pthread", "dl"]
-    compiler_args = ["-g1", "-O3", "-ffast-math", "-mtune=native", "-march=native" ]
+    # not -ffast-math: that assumes no NaNs/infinities (breaking the clamps), and links in code that
+    # switches the whole Python process to flush-to-zero mode. These options are enough for vectorization.
+    compiler_args = ["-g1", "-O3", "-fno-math-errno", "-fno-trapping-math", "-fno-signed-zeros", "-funroll-loops"]
+    machine = platform.machine()
+    if target_arch == "native":
+        if machine.startswith(("ppc", "powerpc")):
+            # gcc on power doesn't know -march, and altivec/vsx have to be asked for explicitly
+            compiler_args += ["-mcpu=native", "-mtune=native", "-maltivec", "-mvsx"]
+        elif sys.platform == "darwin" and machine == "arm64":
+            # apple clang doesn't accept -march=native on Apple Silicon
+            compiler_args += ["-mcpu=apple-m1"]
+        else:
+            compiler_args += ["-mtune=native", "-march=native"]
+    elif target_arch == "avx2":
+        compiler_args += ["-mavx2", "-mfma", "-mbmi2"]
+    if machine.startswith("armv7"):
+        # 32-bit arm (such as Raspberry Pi) doesn't enable NEON by default, 64-bit arm always has it.
+        compiler_args.append("-mfpu=neon")
+    compiler_name = os.path.basename((sysconfig.get_config_var("CC") or "").split(" ")[0])
+    if "gcc" in compiler_name or "clang" in compiler_name or compiler_name == "cc":
+        # link time optimization lets the helper routines in miniaudio.c inline miniaudio's functions
+        compiler_args.append("-flto")
+        linker_args.append("-flto")
+    if sys.version_info >= (3, 9):
+        # since Python 3.9, PyMODINIT_FUNC exports the module init function by itself. All other symbols
+        # can be hidden, so calls between miniaudio's functions don't go through the PLT and can be inlined.
+        compiler_args.append("-fvisibility=hidden")
+        if sys.platform.startswith("linux"):
+            compiler_args.append("-fno-plt")
+    if pgo_mode == "generate":
+        compiler_args.append("-fprofile-generate=" + pgo_dir)
+        linker_args.append("-fprofile-generate=" + pgo_dir)
+    elif pgo_mode == "use":
+        compiler_args += ["-fprofile-use=" + pgo_dir, "-fprofile-correction"]
+elif os.name == "nt":
+    # MSVC: setuptools already uses /O2 /GL and links with /LTCG. The SSE2/AVX2 routines in miniaudio
+    # and in miniaudio.c are enabled regardless of /arch on MSVC, and selected at runtime via cpuid.
+    # Keep /fp:precise like the posix build, /fp:fast would fold away the NaN clamps in the converters.
+    compiler_args = ["/fp:precise"]
+    if target_arch == "avx2":
+        compiler_args.append("/arch:AVX2")
+    if pgo_mode == "generate":
+        linker_args = ["/LTCG", "/GENPROFILE"]
+    elif pgo_mode == "use":
+        linker_args = ["/LTCG", "/USEPROFILE"]
 
 
 ffibuilder.set_source("_miniaudio", """
@@ -810,11 +898,38 @@ ffibuilder.set_source("_miniaudio", """
     /* low-level initialization */
     void init_miniaudio(void);
 
+    /* helper routines from miniaudio.c */
+    void pyma_interleave_stereo_f32(const float* left, const float* right, float* output, size_t frameCount);
+    void pyma_interleave_stereo_s16(const int16_t* left, const int16_t* right, int16_t* output, size_t frameCount);
+    void pyma_deinterleave_stereo_f32(const float* input, float* left, float* right, size_t frameCount);
+    void pyma_deinterleave_stereo_s16(const int16_t* input, int16_t* left, int16_t* right, size_t frameCount);
+    void pyma_s16_to_f32(float* output, const int16_t* input, size_t count);
+    void pyma_f32_to_s16(int16_t* output, const float* input, size_t count);
+    void pyma_s16_to_u8(ma_uint8* output, const int16_t* input, size_t count);
+    void pyma_f32_to_s16_dither(int16_t* output, const float* input, size_t count, ma_dither_mode ditherMode, ma_uint32* pState);
+    void pyma_levels_f32(const float* samples, size_t count, float* peak, double* sumsquares);
+    void pyma_levels_s16(const int16_t* samples, size_t count, int32_t* peak, int64_t* sumsquares);
+    void pyma_flush_denormals(void);
+    typedef struct pyma_prefetch pyma_prefetch;
+    pyma_prefetch* pyma_prefetch_init(ma_format format, ma_uint32 channels, ma_uint32 bufferSizeInFrames, void* pUserData);
+    void pyma_prefetch_uninit(pyma_prefetch* pPrefetch);
+    void pyma_prefetch_reset(pyma_prefetch* pPrefetch);
+    void* pyma_prefetch_get_userdata(pyma_prefetch* pPrefetch);
+    ma_uint32 pyma_prefetch_available_read(pyma_prefetch* pPrefetch);
+    ma_uint32 pyma_prefetch_available_write(pyma_prefetch* pPrefetch);
+    ma_uint32 pyma_prefetch_write(pyma_prefetch* pPrefetch, const void* pFrames, ma_uint32 frameCount);
+    void pyma_prefetch_data_callback(ma_device* pDevice, void* pOutput, const void* pInput, ma_uint32 frameCount);
+    void pyma_passthrough_data_callback(ma_device* pDevice, void* pOutput, const void* pInput, ma_uint32 frameCount);
+    ma_uint64 pyma_resample_f32(const float* pIn, ma_uint64 inFrames, ma_uint32 channels, float* pOut, ma_uint64 outFrames, double step, ma_bool32 hermite);
+    ma_uint64 pyma_decoder_read(ma_decoder* pDecoder, void* pFramesOut, ma_uint64 frameCount, ma_bool32 loop);
+    ma_uint64 pyma_decoder_read_planar(ma_decoder* pDecoder, void** ppPlanes, ma_uint64 frameCount);
+
 """,
                       sources=["miniaudio.c"],
                       include_dirs=[miniaudio_include_dir],
                       libraries=libraries,
                       extra_compile_args=compiler_args,
+                      extra_link_args=linker_args,
                       define_macros=[
                           ("MA_NO_GENERATION", "1")
                       ]
@@ -18,29 +18,35 @@ def choose_device():
 
 
 if __name__ == "__main__":
-    buffer_chunks = []
+    record_seconds = 3
+    selected_device = choose_device()
+    capture = miniaudio.CaptureDevice(buffersize_msec=1000, sample_rate=44100, device_id=selected_device["id"])
+    # preallocate the whole recording buffer, the callback only copies into it
+    samples = array.array('h', bytes(capture.sample_rate * record_seconds * capture.nchannels * capture.sample_width))
+    buffer = memoryview(samples).cast('B')
+    bytes_recorded = 0
 
     def record_to_buffer():
+        global bytes_recorded
         _ = yield
         while True:
             data = yield
             print(".", end="", flush=True)
-            buffer_chunks.append(data)
+            num_bytes = min(len(data), len(buffer) - bytes_recorded)
+            buffer[bytes_recorded:bytes_recorded + num_bytes] = memoryview(data)[:num_bytes]
+            bytes_recorded += num_bytes
 
-    selected_device = choose_device()
-    capture = miniaudio.CaptureDevice(buffersize_msec=1000, sample_rate=44100, device_id=selected_device["id"])
     generator = record_to_buffer()
-    print("Recording for 3 seconds")
+    print("Recording for", record_seconds, "seconds")
     next(generator)
     capture.start(generator)
-    sleep(3)
+    sleep(record_seconds)
     capture.stop()
 
-    buffer = b"".join(buffer_chunks)
-    print("\nRecorded", len(buffer), "bytes")
+    print("\nRecorded", bytes_recorded, "bytes")
     print("Wring to ./capture.wav")
-    samples = array.array('h')
-    samples.frombytes(buffer)
+    buffer.release()
+    del samples[bytes_recorded // capture.sample_width:]
     sound = miniaudio.DecodedSoundFile('capture', capture.nchannels, capture.sample_rate, capture.format, samples)
     miniaudio.wav_write_file('capture.wav', sound)
     print("Recording done")
@@ -3,6 +3,7 @@ Convert an audio file to WAV and different sample formats.
 """
 
 import os
+import math
 import array
 import miniaudio
 
@@ -14,13 +15,14 @@ def samples_path(filename):
 src = miniaudio.decode_file(samples_path("music.ogg"), dither=miniaudio.DitherMode.TRIANGLE)
 print("Source: ", src)
 
-result = miniaudio.DecodedSoundFile("result", 1, 11025, miniaudio.SampleFormat.UNSIGNED8, array.array('b'))
-converted_frames = miniaudio.convert_frames(src.sample_format, src.nchannels, src.sample_rate, src.samples.tobytes(),
-                                            result.sample_format, result.nchannels, result.sample_rate)
-# note: currently it is not possible to provide a dithermode to convert_frames()
-
-result.num_frames = int(len(converted_frames) / result.nchannels / result.sample_width)
-result.samples.frombytes(converted_frames)
+num_frames = math.ceil(src.num_frames * 11025 / src.sample_rate)
+result = miniaudio.DecodedSoundFile("result", 1, 11025, miniaudio.SampleFormat.UNSIGNED8,
+                                    array.array('B', bytes(num_frames)))
+result.num_frames = miniaudio.convert_frames_into(src.sample_format, src.nchannels, src.sample_rate, src.samples,
+                                                  result.sample_format, result.nchannels, result.sample_rate,
+                                                  result.samples)
+# note: currently it is not possible to provide a dithermode to convert_frames_into()
+del result.samples[result.num_frames:]
 
 
 miniaudio.wav_write_file("converted.wav", result)
@@ -14,9 +14,12 @@ class FileSource(miniaudio.StreamableSource):
         self.file = open(filename, "rb")
 
     def read(self, num_bytes: int) -> bytes:
-        print("reading from stream:", num_bytes)
         return self.file.read(num_bytes)
 
+    def readinto(self, buffer: memoryview) -> int:
+        # read directly into the decoder's buffer, this avoids allocating a new bytes object on every read
+        return self.file.readinto(buffer)
+
     def seek(self, offset: int, origin: SeekOrigin) -> bool:
         # note: seek support is usually not needed if you provide the file format to the decoder upfront
         # this is necessary if dealing with a network stream for instance
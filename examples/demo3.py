@@ -17,10 +17,10 @@ def samples_path(filename):
 
 
 def stream_pcm(source):
+    frame_size = channels * sample_width
     required_frames = yield b""  # generator initialization
     while True:
-        required_bytes = required_frames * channels * sample_width
-        sample_data = source.read(required_bytes)
+        sample_data = source.read(required_frames * frame_size)
         if not sample_data:
             break
         print(".", end="", flush=True)
@@ -15,16 +15,20 @@ def playback_stream(stream: Generator[array.array, None, None], num_channels: in
     # awkward buffering and generator stream wrapping to make it suitable for async playback
     # note: stream_file() does this transparently for you and should be used instead in real code.
     buffer = array.array('h')
+    offset = 0      # read position in the buffer, to avoid copying the remainder on every chunk
     num_frames = yield buffer
     chunksize = num_frames * num_channels
     while True:
-        try:
-            while len(buffer) < chunksize:
-                buffer += next(stream)  # fill the buffer
-        except StopIteration:
-            break
-        chunk = buffer[:chunksize]
-        buffer = buffer[chunksize:]
+        if len(buffer) - offset < chunksize:
+            del buffer[:offset]     # drop consumed samples only when we need to fill the buffer
+            offset = 0
+            try:
+                while len(buffer) < chunksize:
+                    buffer += next(stream)  # fill the buffer
+            except StopIteration:
+                break
+        chunk = buffer[offset:offset + chunksize]
+        offset += chunksize
         chunksize = (yield chunk) * num_channels
 
 
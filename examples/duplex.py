@@ -26,19 +26,15 @@ def choose_devices():
 
 
 if __name__ == "__main__":
-    def pass_through():
-        data = yield b""
-        while True:
-            print(".", end="", flush=True)
-            data = yield data
-
     capture_dev, playback_dev = choose_devices()
     duplex = miniaudio.DuplexStream(sample_rate=48000, backends=backends,
-                                    playback_device_id=playback_dev["id"], capture_device_id=capture_dev["id"])
-    generator = pass_through()
-    next(generator)
+                                    playback_device_id=playback_dev["id"], capture_device_id=capture_dev["id"],
+                                    passthrough=True)
     print("Starting duplex stream. Press Ctrl + C to exit.")
-    duplex.start(generator)
+    # the audio is passed through without Python code in the audio thread.
+    # to process it yourself, create the stream without passthrough and use duplex.start(generator)
+    # with a generator that is sent the recorded data.
+    duplex.start_passthrough()
 
     running = True
     while running:
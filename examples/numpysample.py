@@ -24,8 +24,8 @@ def memory_stream(npa: numpy.ndarray) -> miniaudio.PlaybackCallbackGeneratorType
 with miniaudio.PlaybackDevice() as device:
     decoded = miniaudio.decode_file(samples_path("music.wav"))
 
-    # convert the sample data into a numpy array with shape (numframes, numchannels):
-    npa = numpy.array(decoded.samples, dtype=numpy.int16).reshape((-1, decoded.nchannels))
+    # view the sample data as a numpy array with shape (numframes, numchannels), without copying it:
+    npa = miniaudio.as_numpy_array(decoded.samples, decoded.sample_format, decoded.nchannels)
 
     stream = memory_stream(npa)
     next(stream)  # start the generator
@@ -4,6 +4,7 @@ prints some information about it, and plays it without any sample rate/format co
 in the application, if possible.  (conversion may still occur in the backend audio api)
 """
 
+import os
 import sys
 import miniaudio
 
@@ -21,7 +22,7 @@ def stream_file(info, filename):
         try:
             while True:
                 framecount = yield stream.send(framecount)
-                print(".", end="", flush=True)
+                os.write(1, b".")     # plain write to stdout, print() would take the stdout lock and flush
         except StopIteration:
             return
 
@@ -39,7 +40,7 @@ def stream_file(info, filename):
     next(stream)   # start the generator
     with miniaudio.PlaybackDevice(output_format=output_format, sample_rate=info.sample_rate) as device:
         print("playback device backend:", device.backend, device.format.name, device.sample_rate, "hz")
-        print("Audio file playing in the background. Enter to stop playback: ")
+        print("Audio file playing in the background. Enter to stop playback: ", flush=True)
         device.start(stream)
         input()
 
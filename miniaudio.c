@@ -9,6 +9,7 @@ build_ffi_module bootstrap c module code
 #include <stdint.h>
 
 #include "miniaudio/stb_vorbis.c"
+#include "miniaudio/miniaudio.h"
 
 
 #ifdef _WIN32
@@ -24,7 +25,10 @@ int setenv(const char *name, const char *value, int overwrite)
 }
 #endif
 
+static void pyma_detect_cpu_features(void);
+
 void init_miniaudio(void) {
+    pyma_detect_cpu_features();
 
     /*
     Currently, no specific init is needed. For older version of miniaudio, we had this:
@@ -39,4 +43,730 @@ void init_miniaudio(void) {
 }
 
 
+/* Interleave two separate channel buffers into one stereo buffer.
+   Written as a plain indexed loop so the compiler can vectorize it (unpcklps/punpcklwd). */
+void pyma_interleave_stereo_f32(const float* left, const float* right, float* output, size_t frameCount) {
+    size_t i;
+    for(i = 0; i < frameCount; i++) {
+        output[2*i] = left[i];
+        output[2*i+1] = right[i];
+    }
+}
+
+void pyma_interleave_stereo_s16(const int16_t* left, const int16_t* right, int16_t* output, size_t frameCount) {
+    size_t i;
+    for(i = 0; i < frameCount; i++) {
+        output[2*i] = left[i];
+        output[2*i+1] = right[i];
+    }
+}
+
+/* The reverse: split a stereo buffer into two separate channel buffers (shufps, or vld2 on NEON). */
+void pyma_deinterleave_stereo_f32(const float* input, float* left, float* right, size_t frameCount) {
+    size_t i;
+    for(i = 0; i < frameCount; i++) {
+        left[i] = input[2*i];
+        right[i] = input[2*i+1];
+    }
+}
+
+void pyma_deinterleave_stereo_s16(const int16_t* input, int16_t* left, int16_t* right, size_t frameCount) {
+    size_t i;
+    for(i = 0; i < frameCount; i++) {
+        left[i] = input[2*i];
+        right[i] = input[2*i+1];
+    }
+}
+
+
+/*
+Sample format conversion between s16 and f32 (without dithering), with the same scaling as miniaudio's
+own ma_pcm_s16_to_f32 / ma_pcm_f32_to_s16. SSE2 is part of the x86-64 baseline; the AVX2 variants are
+used when the compiler targets AVX2, or otherwise are selected at runtime for portable builds
+(the cpu is checked once, in init_miniaudio). On ARM the NEON variants are used when the compiler targets NEON (always the case on 64-bit ARM).
+*/
+#if defined(__x86_64__) || defined(_M_X64) || (defined(__i386__) && defined(__SSE2__))
+    #define PYMA_X86_SIMD
+    #include <immintrin.h>
+    #if defined(__AVX2__)
+        #define PYMA_AVX2_ALWAYS
+    #elif defined(__GNUC__) || defined(__clang__)
+        #define PYMA_AVX2_RUNTIME
+        #define PYMA_TARGET_AVX2 __attribute__((target("avx2")))
+    #elif defined(_MSC_VER)
+        /* MSVC allows AVX2 intrinsics without any special compiler options */
+        #define PYMA_AVX2_RUNTIME
+        #include <intrin.h>
+    #endif
+#elif defined(__ARM_NEON) || defined(__ARM_NEON__) || defined(_M_ARM64)
+    #define PYMA_NEON_SIMD
+    #include <arm_neon.h>
+#endif
+
+#ifndef PYMA_TARGET_AVX2
+    #define PYMA_TARGET_AVX2
+#endif
+
+#if defined(PYMA_AVX2_RUNTIME)
+static int pyma_cpu_has_avx2 = 0;
+#endif
+
+static void pyma_detect_cpu_features(void) {
+#if defined(PYMA_AVX2_RUNTIME) && defined(_MSC_VER)
+    int info[4];
+    __cpuid(info, 1);
+    /* the cpu must support AVX and the OS must save the AVX registers (OSXSAVE + XCR0 bits 1 and 2) */
+    if((info[2] & (1 << 27)) && (info[2] & (1 << 28)) && (_xgetbv(0) & 6) == 6) {
+        __cpuidex(info, 7, 0);
+        pyma_cpu_has_avx2 = (info[1] & (1 << 5)) != 0;
+    }
+#elif defined(PYMA_AVX2_RUNTIME)
+    __builtin_cpu_init();
+    pyma_cpu_has_avx2 = __builtin_cpu_supports("avx2");
+#endif
+}
+
+
+static void pyma_s16_to_f32__scalar(float* output, const int16_t* input, size_t i, size_t count) {
+    for(; i < count; i++) {
+        output[i] = (float)input[i] * 0.000030517578125f;
+    }
+}
+
+static void pyma_f32_to_s16__scalar(int16_t* output, const float* input, size_t i, size_t count) {
+    for(; i < count; i++) {
+        float x = input[i];
+        x = ((x < -1) ? -1 : ((x > 1) ? 1 : x));
+        output[i] = (int16_t)(x * 32767.0f);
+    }
+}
+
+#if defined(PYMA_AVX2_ALWAYS) || defined(PYMA_AVX2_RUNTIME)
+PYMA_TARGET_AVX2
+static void pyma_s16_to_f32__avx2(float* output, const int16_t* input, size_t count) {
+    const __m256 scale = _mm256_set1_ps(0.000030517578125f);
+    size_t i = 0;
+    for(; i + 16 <= count; i += 16) {
+        __m256i x0 = _mm256_cvtepi16_epi32(_mm_loadu_si128((const __m128i*)(input + i)));
+        __m256i x1 = _mm256_cvtepi16_epi32(_mm_loadu_si128((const __m128i*)(input + i + 8)));
+        _mm256_storeu_ps(output + i, _mm256_mul_ps(_mm256_cvtepi32_ps(x0), scale));
+        _mm256_storeu_ps(output + i + 8, _mm256_mul_ps(_mm256_cvtepi32_ps(x1), scale));
+    }
+    pyma_s16_to_f32__scalar(output, input, i, count);
+}
+
+PYMA_TARGET_AVX2
+static void pyma_f32_to_s16__avx2(int16_t* output, const float* input, size_t count) {
+    const __m256 scale = _mm256_set1_ps(32767.0f);
+    const __m256 lo = _mm256_set1_ps(-1.0f);
+    const __m256 hi = _mm256_set1_ps(1.0f);
+    size_t i = 0;
+    for(; i + 16 <= count; i += 16) {
+        __m256 x0 = _mm256_min_ps(_mm256_max_ps(_mm256_loadu_ps(input + i), lo), hi);
+        __m256 x1 = _mm256_min_ps(_mm256_max_ps(_mm256_loadu_ps(input + i + 8), lo), hi);
+        __m256i packed = _mm256_packs_epi32(_mm256_cvttps_epi32(_mm256_mul_ps(x0, scale)),
+                                            _mm256_cvttps_epi32(_mm256_mul_ps(x1, scale)));
+        /* packs works per 128-bit lane, restore the sample order */
+        packed = _mm256_permute4x64_epi64(packed, _MM_SHUFFLE(3, 1, 2, 0));
+        _mm256_storeu_si256((__m256i*)(output + i), packed);
+    }
+    pyma_f32_to_s16__scalar(output, input, i, count);
+}
+#endif
+
+#if defined(PYMA_X86_SIMD) && !defined(PYMA_AVX2_ALWAYS)
+static void pyma_s16_to_f32__sse2(float* output, const int16_t* input, size_t count) {
+    const __m128 scale = _mm_set1_ps(0.000030517578125f);
+    size_t i = 0;
+    for(; i + 8 <= count; i += 8) {
+        __m128i x = _mm_loadu_si128((const __m128i*)(input + i));
+        __m128i x0 = _mm_srai_epi32(_mm_unpacklo_epi16(x, x), 16);
+        __m128i x1 = _mm_srai_epi32(_mm_unpackhi_epi16(x, x), 16);
+        _mm_storeu_ps(output + i, _mm_mul_ps(_mm_cvtepi32_ps(x0), scale));
+        _mm_storeu_ps(output + i + 4, _mm_mul_ps(_mm_cvtepi32_ps(x1), scale));
+    }
+    pyma_s16_to_f32__scalar(output, input, i, count);
+}
+
+static void pyma_f32_to_s16__sse2(int16_t* output, const float* input, size_t count) {
+    const __m128 scale = _mm_set1_ps(32767.0f);
+    const __m128 lo = _mm_set1_ps(-1.0f);
+    const __m128 hi = _mm_set1_ps(1.0f);
+    size_t i = 0;
+    for(; i + 8 <= count; i += 8) {
+        __m128 x0 = _mm_min_ps(_mm_max_ps(_mm_loadu_ps(input + i), lo), hi);
+        __m128 x1 = _mm_min_ps(_mm_max_ps(_mm_loadu_ps(input + i + 4), lo), hi);
+        __m128i packed = _mm_packs_epi32(_mm_cvttps_epi32(_mm_mul_ps(x0, scale)),
+                                         _mm_cvttps_epi32(_mm_mul_ps(x1, scale)));
+        _mm_storeu_si128((__m128i*)(output + i), packed);
+    }
+    pyma_f32_to_s16__scalar(output, input, i, count);
+}
+#endif
+
+#if defined(PYMA_NEON_SIMD)
+static void pyma_s16_to_f32__neon(float* output, const int16_t* input, size_t count) {
+    const float32x4_t scale = vdupq_n_f32(0.000030517578125f);
+    size_t i = 0;
+    for(; i + 8 <= count; i += 8) {
+        int16x8_t x = vld1q_s16(input + i);
+        vst1q_f32(output + i, vmulq_f32(vcvtq_f32_s32(vmovl_s16(vget_low_s16(x))), scale));
+        vst1q_f32(output + i + 4, vmulq_f32(vcvtq_f32_s32(vmovl_s16(vget_high_s16(x))), scale));
+    }
+    pyma_s16_to_f32__scalar(output, input, i, count);
+}
+
+static void pyma_f32_to_s16__neon(int16_t* output, const float* input, size_t count) {
+    const float32x4_t scale = vdupq_n_f32(32767.0f);
+    const float32x4_t lo = vdupq_n_f32(-1.0f);
+    const float32x4_t hi = vdupq_n_f32(1.0f);
+    size_t i = 0;
+    for(; i + 8 <= count; i += 8) {
+        float32x4_t x0 = vminq_f32(vmaxq_f32(vld1q_f32(input + i), lo), hi);
+        float32x4_t x1 = vminq_f32(vmaxq_f32(vld1q_f32(input + i + 4), lo), hi);
+        /* vcvtq_s32_f32 truncates toward zero, like the scalar cast */
+        int16x4_t s0 = vqmovn_s32(vcvtq_s32_f32(vmulq_f32(x0, scale)));
+        int16x4_t s1 = vqmovn_s32(vcvtq_s32_f32(vmulq_f32(x1, scale)));
+        vst1q_s16(output + i, vcombine_s16(s0, s1));
+    }
+    pyma_f32_to_s16__scalar(output, input, i, count);
+}
+#endif
+
+void pyma_s16_to_f32(float* output, const int16_t* input, size_t count) {
+#if defined(PYMA_AVX2_ALWAYS)
+    pyma_s16_to_f32__avx2(output, input, count);
+#elif defined(PYMA_X86_SIMD)
+    #if defined(PYMA_AVX2_RUNTIME)
+    if(pyma_cpu_has_avx2) {
+        pyma_s16_to_f32__avx2(output, input, count);
+        return;
+    }
+    #endif
+    pyma_s16_to_f32__sse2(output, input, count);
+#elif defined(PYMA_NEON_SIMD)
+    pyma_s16_to_f32__neon(output, input, count);
+#else
+    pyma_s16_to_f32__scalar(output, input, 0, count);
+#endif
+}
+
+void pyma_f32_to_s16(int16_t* output, const float* input, size_t count) {
+#if defined(PYMA_AVX2_ALWAYS)
+    pyma_f32_to_s16__avx2(output, input, count);
+#elif defined(PYMA_X86_SIMD)
+    #if defined(PYMA_AVX2_RUNTIME)
+    if(pyma_cpu_has_avx2) {
+        pyma_f32_to_s16__avx2(output, input, count);
+        return;
+    }
+    #endif
+    pyma_f32_to_s16__sse2(output, input, count);
+#elif defined(PYMA_NEON_SIMD)
+    pyma_f32_to_s16__neon(output, input, count);
+#else
+    pyma_f32_to_s16__scalar(output, input, 0, count);
+#endif
+}
+
+
+/* s16 to u8 without dither, the same as miniaudio's ma_pcm_s16_to_u8: keep the high byte and add 128. */
+static void pyma_s16_to_u8__scalar(ma_uint8* output, const int16_t* input, size_t i, size_t count) {
+    for(; i < count; i++) {
+        output[i] = (ma_uint8)((input[i] >> 8) + 128);
+    }
+}
+
+#if defined(PYMA_AVX2_ALWAYS) || defined(PYMA_AVX2_RUNTIME)
+PYMA_TARGET_AVX2
+static void pyma_s16_to_u8__avx2(ma_uint8* output, const int16_t* input, size_t count) {
+    const __m256i bias = _mm256_set1_epi8((char)0x80);
+    size_t i = 0;
+    for(; i + 32 <= count; i += 32) {
+        __m256i x0 = _mm256_srai_epi16(_mm256_loadu_si256((const __m256i*)(input + i)), 8);
+        __m256i x1 = _mm256_srai_epi16(_mm256_loadu_si256((const __m256i*)(input + i + 16)), 8);
+        /* packs works per 128-bit lane, restore the sample order */
+        __m256i packed = _mm256_permute4x64_epi64(_mm256_packs_epi16(x0, x1), _MM_SHUFFLE(3, 1, 2, 0));
+        _mm256_storeu_si256((__m256i*)(output + i), _mm256_xor_si256(packed, bias));
+    }
+    pyma_s16_to_u8__scalar(output, input, i, count);
+}
+#endif
+
+#if defined(PYMA_X86_SIMD) && !defined(PYMA_AVX2_ALWAYS)
+static void pyma_s16_to_u8__sse2(ma_uint8* output, const int16_t* input, size_t count) {
+    const __m128i bias = _mm_set1_epi8((char)0x80);
+    size_t i = 0;
+    for(; i + 16 <= count; i += 16) {
+        __m128i x0 = _mm_srai_epi16(_mm_loadu_si128((const __m128i*)(input + i)), 8);
+        __m128i x1 = _mm_srai_epi16(_mm_loadu_si128((const __m128i*)(input + i + 8)), 8);
+        _mm_storeu_si128((__m128i*)(output + i), _mm_xor_si128(_mm_packs_epi16(x0, x1), bias));
+    }
+    pyma_s16_to_u8__scalar(output, input, i, count);
+}
+#endif
+
+#if defined(PYMA_NEON_SIMD)
+static void pyma_s16_to_u8__neon(ma_uint8* output, const int16_t* input, size_t count) {
+    const uint8x16_t bias = vdupq_n_u8(0x80);
+    size_t i = 0;
+    for(; i + 16 <= count; i += 16) {
+        int8x8_t x0 = vshrn_n_s16(vld1q_s16(input + i), 8);
+        int8x8_t x1 = vshrn_n_s16(vld1q_s16(input + i + 8), 8);
+        vst1q_u8(output + i, veorq_u8(vreinterpretq_u8_s8(vcombine_s8(x0, x1)), bias));
+    }
+    pyma_s16_to_u8__scalar(output, input, i, count);
+}
+#endif
+
+void pyma_s16_to_u8(ma_uint8* output, const int16_t* input, size_t count) {
+#if defined(PYMA_AVX2_ALWAYS)
+    pyma_s16_to_u8__avx2(output, input, count);
+#elif defined(PYMA_X86_SIMD)
+    #if defined(PYMA_AVX2_RUNTIME)
+    if(pyma_cpu_has_avx2) {
+        pyma_s16_to_u8__avx2(output, input, count);
+        return;
+    }
+    #endif
+    pyma_s16_to_u8__sse2(output, input, count);
+#elif defined(PYMA_NEON_SIMD)
+    pyma_s16_to_u8__neon(output, input, count);
+#else
+    pyma_s16_to_u8__scalar(output, input, 0, count);
+#endif
+}
+
+
+/*
+f32 to s16 conversion with rectangle or triangle (TPDF) dither of +/- 1 LSB, with the same scaling as
+miniaudio's dithered ma_pcm_f32_to_s16. The noise comes from 8 independent xorshift32 generators,
+one per lane, so the inner loop is vectorized by the compiler. Each 32-bit random number provides the two
+16-bit uniform values needed for triangle dither. pState holds the 8 generator states (nonzero) and is updated.
+*/
+#define PYMA_DITHER_LANES 8
+
+void pyma_f32_to_s16_dither(int16_t* output, const float* input, size_t count, ma_dither_mode ditherMode,
+                            ma_uint32* pState) {
+    const float ditherMin = 1.0f / -32768;
+    const float ditherMax = 1.0f / 32767;
+    const float uniformScale = 1.0f / 65536;
+    ma_uint32 state[PYMA_DITHER_LANES];
+    float noise[PYMA_DITHER_LANES];
+    size_t i, lane;
+    for(lane = 0; lane < PYMA_DITHER_LANES; lane++) {
+        state[lane] = pState[lane] ? pState[lane] : 0x9E3779B9u + (ma_uint32)lane;
+    }
+    for(i = 0; i < count; i += PYMA_DITHER_LANES) {
+        size_t n = count - i < PYMA_DITHER_LANES ? count - i : PYMA_DITHER_LANES;
+        for(lane = 0; lane < PYMA_DITHER_LANES; lane++) {
+            ma_uint32 r = state[lane];
+            float u1, u2;
+            r ^= r << 13;
+            r ^= r >> 17;
+            r ^= r << 5;
+            state[lane] = r;
+            u1 = (float)(r & 0xFFFF) * uniformScale;
+            u2 = (float)(r >> 16) * uniformScale;
+            if(ditherMode == ma_dither_mode_triangle) {
+                noise[lane] = ditherMin * u1 + ditherMax * u2;
+            } else {
+                noise[lane] = ditherMin + (ditherMax - ditherMin) * u1;
+            }
+        }
+        for(lane = 0; lane < n; lane++) {
+            float x = input[i + lane] + noise[lane];
+            x = ((x < -1) ? -1 : ((x > 1) ? 1 : x));
+            output[i + lane] = (int16_t)(x * 32767.0f);
+        }
+    }
+    for(lane = 0; lane < PYMA_DITHER_LANES; lane++) {
+        pState[lane] = state[lane];
+    }
+}
+
+/*
+Peak (maximum absolute value) and sum of squares of a block of f32 samples, in a single pass.
+The squares are summed per block of 4096 samples in float lanes and then accumulated in a double.
+*/
+#define PYMA_LEVELS_BLOCK 4096
+
+static void pyma_levels_f32__scalar(const float* samples, size_t i, size_t count, float* peak, double* sumsquares) {
+    float p = *peak;
+    double sum = 0.0;
+    for(; i < count; i++) {
+        float x = samples[i];
+        float a = x < 0 ? -x : x;
+        p = a > p ? a : p;
+        sum += (double)(x * x);
+    }
+    *peak = p;
+    *sumsquares += sum;
+}
+
+#if defined(PYMA_AVX2_ALWAYS) || defined(PYMA_AVX2_RUNTIME)
+PYMA_TARGET_AVX2
+static void pyma_levels_f32__avx2(const float* samples, size_t count, float* peak, double* sumsquares) {
+    const __m256 signmask = _mm256_set1_ps(-0.0f);
+    __m256 p = _mm256_setzero_ps();
+    float lanes[8];
+    size_t i = 0, k;
+    while(i + 8 <= count) {
+        size_t end = i + PYMA_LEVELS_BLOCK < count ? i + PYMA_LEVELS_BLOCK : count;
+        __m256 s = _mm256_setzero_ps();
+        for(; i + 8 <= end; i += 8) {
+            __m256 x = _mm256_loadu_ps(samples + i);
+            p = _mm256_max_ps(p, _mm256_andnot_ps(signmask, x));
+            s = _mm256_add_ps(s, _mm256_mul_ps(x, x));
+        }
+        _mm256_storeu_ps(lanes, s);
+        for(k = 0; k < 8; k++) {
+            *sumsquares += lanes[k];
+        }
+    }
+    _mm256_storeu_ps(lanes, p);
+    for(k = 0; k < 8; k++) {
+        *peak = lanes[k] > *peak ? lanes[k] : *peak;
+    }
+    pyma_levels_f32__scalar(samples, i, count, peak, sumsquares);
+}
+#endif
+
+#if defined(PYMA_X86_SIMD) && !defined(PYMA_AVX2_ALWAYS)
+static void pyma_levels_f32__sse2(const float* samples, size_t count, float* peak, double* sumsquares) {
+    const __m128 signmask = _mm_set1_ps(-0.0f);
+    __m128 p = _mm_setzero_ps();
+    float lanes[4];
+    size_t i = 0, k;
+    while(i + 4 <= count) {
+        size_t end = i + PYMA_LEVELS_BLOCK < count ? i + PYMA_LEVELS_BLOCK : count;
+        __m128 s = _mm_setzero_ps();
+        for(; i + 4 <= end; i += 4) {
+            __m128 x = _mm_loadu_ps(samples + i);
+            p = _mm_max_ps(p, _mm_andnot_ps(signmask, x));
+            s = _mm_add_ps(s, _mm_mul_ps(x, x));
+        }
+        _mm_storeu_ps(lanes, s);
+        for(k = 0; k < 4; k++) {
+            *sumsquares += lanes[k];
+        }
+    }
+    _mm_storeu_ps(lanes, p);
+    for(k = 0; k < 4; k++) {
+        *peak = lanes[k] > *peak ? lanes[k] : *peak;
+    }
+    pyma_levels_f32__scalar(samples, i, count, peak, sumsquares);
+}
+#endif
+
+void pyma_levels_f32(const float* samples, size_t count, float* peak, double* sumsquares) {
+    *peak = 0.0f;
+    *sumsquares = 0.0;
+#if defined(PYMA_AVX2_ALWAYS)
+    pyma_levels_f32__avx2(samples, count, peak, sumsquares);
+#elif defined(PYMA_X86_SIMD)
+    #if defined(PYMA_AVX2_RUNTIME)
+    if(pyma_cpu_has_avx2) {
+        pyma_levels_f32__avx2(samples, count, peak, sumsquares);
+        return;
+    }
+    #endif
+    pyma_levels_f32__sse2(samples, count, peak, sumsquares);
+#else
+    pyma_levels_f32__scalar(samples, 0, count, peak, sumsquares);
+#endif
+}
+
+/* The same for s16 samples. This simple loop is vectorized well enough by the compiler. */
+void pyma_levels_s16(const int16_t* samples, size_t count, int32_t* peak, int64_t* sumsquares) {
+    int32_t p = 0;
+    int64_t sum = 0;
+    size_t i;
+    for(i = 0; i < count; i++) {
+        int32_t x = samples[i];
+        int32_t a = x < 0 ? -x : x;
+        p = a > p ? a : p;
+        sum += x * x;
+    }
+    *peak = p;
+    *sumsquares = sum;
+}
+
+
+/*
+Make the calling thread flush denormal floats to zero (FTZ and DAZ on x86, FZ on arm64).
+Denormals can appear in decaying signals and are extremely slow to compute with on most cpus,
+which may cause glitches in the realtime audio thread. The setting is per thread.
+*/
+void pyma_flush_denormals(void) {
+#if defined(__x86_64__) || defined(_M_X64) || (defined(__i386__) && defined(__SSE2__))
+    _mm_setcsr(_mm_getcsr() | 0x8040);      /* FTZ (bit 15) | DAZ (bit 6) */
+#elif defined(__aarch64__) && (defined(__GNUC__) || defined(__clang__))
+    uint64_t fpcr;
+    __asm__ __volatile__("mrs %0, fpcr" : "=r"(fpcr));
+    __asm__ __volatile__("msr fpcr, %0" : : "r"(fpcr | (1 << 24)));
+#endif
+}
+
+
+/*
+Playback from a ring buffer that is filled ahead of time by a (Python) producer thread.
+The device's data callback is plain C, so the realtime audio thread never has to wait for the GIL.
+*/
+typedef struct pyma_prefetch pyma_prefetch;
+
+struct pyma_prefetch {
+    void* pUserData;                /* the user data (python handle) for the stop callback */
+    ma_pcm_rb ringbuffer;
+    ma_uint32 bytesPerFrame;
+    ma_bool32 audioThreadSetup;
+};
+
+pyma_prefetch* pyma_prefetch_init(ma_format format, ma_uint32 channels, ma_uint32 bufferSizeInFrames, void* pUserData) {
+    pyma_prefetch* pPrefetch = (pyma_prefetch*)ma_malloc(sizeof(*pPrefetch), NULL);
+    if(pPrefetch == NULL) {
+        return NULL;
+    }
+    memset(pPrefetch, 0, sizeof(*pPrefetch));
+    if(ma_pcm_rb_init(format, channels, bufferSizeInFrames, NULL, NULL, &pPrefetch->ringbuffer) != MA_SUCCESS) {
+        ma_free(pPrefetch, NULL);
+        return NULL;
+    }
+    pPrefetch->pUserData = pUserData;
+    pPrefetch->bytesPerFrame = ma_get_bytes_per_frame(format, channels);
+    return pPrefetch;
+}
+
+void pyma_prefetch_uninit(pyma_prefetch* pPrefetch) {
+    ma_pcm_rb_uninit(&pPrefetch->ringbuffer);
+    ma_free(pPrefetch, NULL);
+}
+
+void pyma_prefetch_reset(pyma_prefetch* pPrefetch) {
+    ma_pcm_rb_reset(&pPrefetch->ringbuffer);
+}
+
+void* pyma_prefetch_get_userdata(pyma_prefetch* pPrefetch) {
+    return pPrefetch->pUserData;
+}
+
+ma_uint32 pyma_prefetch_available_read(pyma_prefetch* pPrefetch) {
+    return ma_pcm_rb_available_read(&pPrefetch->ringbuffer);
+}
+
+ma_uint32 pyma_prefetch_available_write(pyma_prefetch* pPrefetch) {
+    return ma_pcm_rb_available_write(&pPrefetch->ringbuffer);
+}
+
+ma_uint32 pyma_prefetch_write(pyma_prefetch* pPrefetch, const void* pFrames, ma_uint32 frameCount) {
+    ma_uint32 framesWritten = 0;
+    while(framesWritten < frameCount) {
+        ma_uint32 frames = frameCount - framesWritten;
+        void* pWriteBuffer;
+        if(ma_pcm_rb_acquire_write(&pPrefetch->ringbuffer, &frames, &pWriteBuffer) != MA_SUCCESS || frames == 0) {
+            break;
+        }
+        memcpy(pWriteBuffer, (const ma_uint8*)pFrames + framesWritten * pPrefetch->bytesPerFrame, frames * pPrefetch->bytesPerFrame);
+        if(ma_pcm_rb_commit_write(&pPrefetch->ringbuffer, frames, pWriteBuffer) != MA_SUCCESS) {
+            break;
+        }
+        framesWritten += frames;
+    }
+    return framesWritten;
+}
+
+void pyma_prefetch_data_callback(ma_device* pDevice, void* pOutput, const void* pInput, ma_uint32 frameCount) {
+    pyma_prefetch* pPrefetch = (pyma_prefetch*)pDevice->pUserData;
+    ma_uint8* pOut = (ma_uint8*)pOutput;
+    (void)pInput;
+    if(!pPrefetch->audioThreadSetup) {
+        pyma_flush_denormals();
+        pPrefetch->audioThreadSetup = MA_TRUE;
+    }
+    while(frameCount > 0) {
+        ma_uint32 frames = frameCount;
+        void* pReadBuffer;
+        if(ma_pcm_rb_acquire_read(&pPrefetch->ringbuffer, &frames, &pReadBuffer) != MA_SUCCESS || frames == 0) {
+            break;      /* underrun, the rest of the output stays silent */
+        }
+        memcpy(pOut, pReadBuffer, frames * pPrefetch->bytesPerFrame);
+        if(ma_pcm_rb_commit_read(&pPrefetch->ringbuffer, frames, pReadBuffer) != MA_SUCCESS) {
+            break;
+        }
+        pOut += frames * pPrefetch->bytesPerFrame;
+        frameCount -= frames;
+    }
+}
+
+
+/* Duplex data callback that plays the captured audio directly, without calling into Python.
+   The capture and playback channel counts must be the same, only the sample format is converted. */
+void pyma_passthrough_data_callback(ma_device* pDevice, void* pOutput, const void* pInput, ma_uint32 frameCount) {
+    ma_pcm_convert(pOutput, pDevice->playback.format, pInput, pDevice->capture.format,
+                   (ma_uint64)frameCount * pDevice->capture.channels, ma_dither_mode_none);
+}
+
+
+
+/*
+Simple and fast resampling of f32 frames, with linear or 4-point (Catmull-Rom) Hermite interpolation.
+The step is the input sample rate divided by the output sample rate. There is no low-pass filtering,
+so use ma_convert_frames() instead when downsampling material with a lot of high frequency content.
+Frames near the edges are interpolated with the first/last frame repeated. Returns the number of output frames.
+*/
+static float pyma_hermite(float xm1, float x0, float x1, float x2, float t) {
+    float c1 = 0.5f * (x1 - xm1);
+    float c2 = xm1 - 2.5f * x0 + 2.0f * x1 - 0.5f * x2;
+    float c3 = 0.5f * (x2 - xm1) + 1.5f * (x0 - x1);
+    return ((c3 * t + c2) * t + c1) * t + x0;
+}
+
+static void pyma_resample_frame__scalar(const float* pIn, ma_uint64 inFrames, ma_uint32 channels, float* pOut,
+                                        ma_uint64 index, float t, ma_bool32 hermite) {
+    ma_uint64 last = inFrames - 1;
+    const float* f0 = pIn + (index < last ? index : last) * channels;
+    const float* f1 = pIn + (index + 1 < last ? index + 1 : last) * channels;
+    ma_uint32 c;
+    if(hermite) {
+        const float* fm1 = pIn + (index > 0 ? index - 1 : 0) * channels;
+        const float* f2 = pIn + (index + 2 < last ? index + 2 : last) * channels;
+        for(c = 0; c < channels; c++) {
+            pOut[c] = pyma_hermite(fm1[c], f0[c], f1[c], f2[c], t);
+        }
+    } else {
+        for(c = 0; c < channels; c++) {
+            pOut[c] = f0[c] + (f1[c] - f0[c]) * t;
+        }
+    }
+}
+
+#if defined(PYMA_X86_SIMD)
+/* stereo: one output frame per iteration, loading pairs of adjacent frames as [L R L R] in a single register */
+static void pyma_resample_stereo__sse2(const float* pIn, ma_uint64 inFrames, float* pOut,
+                                       ma_uint64 outFrames, double step, ma_bool32 hermite) {
+    ma_uint64 i;
+    for(i = 0; i < outFrames; i++) {
+        double pos = (double)i * step;
+        ma_uint64 index = (ma_uint64)pos;
+        float frac = (float)(pos - (double)index);
+        __m128 t = _mm_set1_ps(frac);
+        __m128 y;
+        if(hermite) {
+            __m128 v0, v1, xm1, x0, x1, x2, c1, c2, c3;
+            if(index < 1 || index + 3 > inFrames) {
+                pyma_resample_frame__scalar(pIn, inFrames, 2, pOut + i * 2, index, frac, hermite);
+                continue;
+            }
+            v0 = _mm_loadu_ps(pIn + (index - 1) * 2);
+            v1 = _mm_loadu_ps(pIn + (index + 1) * 2);
+            xm1 = _mm_movelh_ps(v0, v0);
+            x0 = _mm_movehl_ps(v0, v0);
+            x1 = _mm_movelh_ps(v1, v1);
+            x2 = _mm_movehl_ps(v1, v1);
+            c1 = _mm_mul_ps(_mm_set1_ps(0.5f), _mm_sub_ps(x1, xm1));
+            c2 = _mm_sub_ps(_mm_add_ps(xm1, _mm_mul_ps(_mm_set1_ps(2.0f), x1)),
+                            _mm_add_ps(_mm_mul_ps(_mm_set1_ps(2.5f), x0), _mm_mul_ps(_mm_set1_ps(0.5f), x2)));
+            c3 = _mm_add_ps(_mm_mul_ps(_mm_set1_ps(0.5f), _mm_sub_ps(x2, xm1)),
+                            _mm_mul_ps(_mm_set1_ps(1.5f), _mm_sub_ps(x0, x1)));
+            y = _mm_add_ps(_mm_mul_ps(_mm_add_ps(_mm_mul_ps(_mm_add_ps(_mm_mul_ps(c3, t), c2), t), c1), t), x0);
+        } else {
+            __m128 v, x0, x1;
+            if(index + 2 > inFrames) {
+                pyma_resample_frame__scalar(pIn, inFrames, 2, pOut + i * 2, index, frac, hermite);
+                continue;
+            }
+            v = _mm_loadu_ps(pIn + index * 2);
+            x0 = _mm_movelh_ps(v, v);
+            x1 = _mm_movehl_ps(v, v);
+            y = _mm_add_ps(x0, _mm_mul_ps(_mm_sub_ps(x1, x0), t));
+        }
+        _mm_storel_pi((__m64*)(pOut + i * 2), y);
+    }
+}
+#endif
+
+ma_uint64 pyma_resample_f32(const float* pIn, ma_uint64 inFrames, ma_uint32 channels, float* pOut,
+                            ma_uint64 outFrames, double step, ma_bool32 hermite) {
+    ma_uint64 i;
+    if(inFrames == 0 || channels == 0) {
+        return 0;
+    }
+#if defined(PYMA_X86_SIMD)
+    if(channels == 2) {
+        pyma_resample_stereo__sse2(pIn, inFrames, pOut, outFrames, step, hermite);
+        return outFrames;
+    }
+#endif
+    for(i = 0; i < outFrames; i++) {
+        double pos = (double)i * step;
+        ma_uint64 index = (ma_uint64)pos;
+        pyma_resample_frame__scalar(pIn, inFrames, channels, pOut + i * channels, index,
+                                    (float)(pos - (double)index), hermite);
+    }
+    return outFrames;
+}
+
+/*
+Read frames from a decoder until the requested number of frames has been read, all in C.
+If loop is true, the decoder is rewound to the start when it reaches the end of the stream.
+Returns the number of frames read, which is only less than requested at the end of a non-looping stream.
+*/
+ma_uint64 pyma_decoder_read(ma_decoder* pDecoder, void* pFramesOut, ma_uint64 frameCount, ma_bool32 loop) {
+    ma_uint8* pOut = (ma_uint8*)pFramesOut;
+    ma_uint32 bytesPerFrame = ma_get_bytes_per_frame(pDecoder->outputFormat, pDecoder->outputChannels);
+    ma_uint64 totalFramesRead = 0;
+    ma_bool32 rewound = MA_FALSE;
+    while(totalFramesRead < frameCount) {
+        ma_uint64 framesRead = ma_decoder_read_pcm_frames(pDecoder, pOut, frameCount - totalFramesRead);
+        if(framesRead == 0) {
+            /* end of stream; stop if not looping or if the stream is empty right after rewinding */
+            if(!loop || rewound || ma_decoder_seek_to_pcm_frame(pDecoder, 0) != MA_SUCCESS) {
+                break;
+            }
+            rewound = MA_TRUE;
+            continue;
+        }
+        rewound = MA_FALSE;
+        totalFramesRead += framesRead;
+        pOut += framesRead * bytesPerFrame;
+    }
+    return totalFramesRead;
+}
+
+/*
+Read frames from a decoder into separate buffers per channel (planar layout), via a small scratch
+buffer on the stack that stays in cache. ppPlanes must contain one buffer per decoder output channel.
+Returns the number of frames read.
+*/
+ma_uint64 pyma_decoder_read_planar(ma_decoder* pDecoder, void** ppPlanes, ma_uint64 frameCount) {
+    ma_uint8 scratch[4096];
+    void* pChannelPtrs[MA_MAX_CHANNELS];
+    ma_uint32 channels = pDecoder->outputChannels;
+    ma_uint32 bytesPerSample = ma_get_bytes_per_sample(pDecoder->outputFormat);
+    ma_uint64 scratchFrames;
+    ma_uint64 totalFramesRead = 0;
+    ma_uint32 c;
+    if(channels == 0 || channels > MA_MAX_CHANNELS || bytesPerSample == 0) {
+        return 0;
+    }
+    scratchFrames = sizeof(scratch) / (bytesPerSample * channels);
+    while(totalFramesRead < frameCount) {
+        ma_uint64 framesToRead = frameCount - totalFramesRead;
+        ma_uint64 framesRead;
+        if(framesToRead > scratchFrames) {
+            framesToRead = scratchFrames;
+        }
+        framesRead = ma_decoder_read_pcm_frames(pDecoder, scratch, framesToRead);
+        if(framesRead == 0) {
+            break;
+        }
+        for(c = 0; c < channels; c++) {
+            pChannelPtrs[c] = (ma_uint8*)ppPlanes[c] + totalFramesRead * bytesPerSample;
+        }
+        ma_deinterleave_pcm_frames(pDecoder->outputFormat, channels, framesRead, scratch, pChannelPtrs);
+        totalFramesRead += framesRead;
+    }
+    return totalFramesRead;
+}
+
 /* Nothing more to do here; all the decoder source is in their own single source/include file */
@@ -19,7 +19,7 @@ import inspect
 import time
 import threading
 from enum import Enum
-from typing import Generator, List, Dict, Set, Optional, Union, Any, Callable
+from typing import Generator, List, Dict, Set, Optional, Union, Any, Callable, Tuple
 from _miniaudio import ffi, lib
 try:
     import numpy
@@ -28,6 +28,9 @@ except ImportError:
 
 lib.init_miniaudio()
 
+# allocator for the (large) decoder structs and decode buffers, that are fully overwritten before use anyway
+_new_uncleared = ffi.new_allocator(should_clear_after_alloc=False)
+
 
 class FileFormat(Enum):
     """Audio file format"""
@@ -246,7 +249,7 @@ def vorbis_get_file_info(filename: str) -> SoundFileInfo:
 def vorbis_get_info(data: bytes) -> SoundFileInfo:
     """Fetch some information about the audio data (vorbis format)."""
     with ffi.new("int *") as error:
-        vorbis = lib.stb_vorbis_open_memory(data, len(data), error, ffi.NULL)
+        vorbis = lib.stb_vorbis_open_memory(ffi.from_buffer("unsigned char[]", data), len(data), error, ffi.NULL)
         if not vorbis:
             raise DecodeError("could not open/decode data")
         try:
@@ -278,7 +281,8 @@ def vorbis_read_file(filename: str) -> DecodedSoundFile:
 def vorbis_read(data: bytes) -> DecodedSoundFile:
     """Reads and decodes the whole vorbis audio data. Resulting sample format is 16 bits signed integer."""
     with ffi.new("int *") as channels, ffi.new("int *") as sample_rate, ffi.new("short **") as output:
-        num_samples = lib.stb_vorbis_decode_memory(data, len(data), channels, sample_rate, output)
+        num_samples = lib.stb_vorbis_decode_memory(ffi.from_buffer("unsigned char[]", data), len(data),
+                                                   channels, sample_rate, output)
         if num_samples <= 0:
             raise DecodeError("cannot load/decode data")
         try:
@@ -292,7 +296,7 @@ def vorbis_read(data: bytes) -> DecodedSoundFile:
 
 def vorbis_stream_file(filename: str, seek_frame: int = 0) -> Generator[array.array, None, None]:
     """Streams the ogg vorbis audio file as interleaved 16 bit signed integer sample arrays segments.
-    This uses a variable unconfigurable chunk size and cannot be used as a generic miniaudio decoder input stream.
+    This uses an unconfigurable chunk size and cannot be used as a generic miniaudio decoder input stream.
     Consider using stream_file() instead."""
     filenamebytes = _get_filename_bytes(filename)
     with ffi.new("int *") as error:
@@ -301,28 +305,23 @@ def vorbis_stream_file(filename: str, seek_frame: int = 0) -> Generator[array.ar
             raise DecodeError("could not open/decode file")
         try:
             info = lib.stb_vorbis_get_info(vorbis)
-            with ffi.new("short[]", 4096 * info.channels) as decode_buffer1, \
-                ffi.new("short[]", 4096 * info.channels) as decode_buffer2:
-                decodebuf_ptr1 = ffi.cast("short *", decode_buffer1)
-                decodebuf_ptr2 = ffi.cast("short *", decode_buffer2)
+            channels = info.channels
+            frame_size = 2 * channels
+            typecode = _create_int_array(2).typecode
+            with _new_uncleared("short[]", 4096 * info.channels) as decode_buffer:
+                decodebuf_ptr = ffi.cast("short *", decode_buffer)
                 if seek_frame > 0:
                     result = lib.stb_vorbis_seek_frame(vorbis, seek_frame)
                     if result <= 0:
                         raise DecodeError("can't seek")
-                # note: we decode several frames to reduce the overhead of very small sample sizes a little
+                # note: this decodes as many vorbis frames as needed to fill the buffer, in a single call
                 while True:
-                    num_samples1 = lib.stb_vorbis_get_frame_short_interleaved(vorbis, info.channels, decodebuf_ptr1,
-                                                                              4096 * info.channels)
-                    num_samples2 = lib.stb_vorbis_get_frame_short_interleaved(vorbis, info.channels, decodebuf_ptr2,
-                                                                              4096 * info.channels)
-                    if num_samples1 + num_samples2 <= 0:
+                    num_frames = lib.stb_vorbis_get_samples_short_interleaved(vorbis, channels, decodebuf_ptr,
+                                                                              4096 * channels)
+                    if num_frames <= 0:
                         break
-                    buffer = ffi.buffer(decode_buffer1, num_samples1 * 2 * info.channels)
-                    samples = _create_int_array(2)
-                    samples.frombytes(buffer)
-                    if num_samples2 > 0:
-                        buffer = ffi.buffer(decode_buffer2, num_samples2 * 2 * info.channels)
-                        samples.frombytes(buffer)
+                    samples = array.array(typecode)
+                    samples.frombytes(ffi.buffer(decode_buffer, num_frames * frame_size))
                     yield samples
         finally:
             lib.stb_vorbis_close(vorbis)
@@ -345,7 +344,7 @@ def flac_get_file_info(filename: str) -> SoundFileInfo:
 
 def flac_get_info(data: bytes) -> SoundFileInfo:
     """Fetch some information about the audio data (flac format)."""
-    flac = lib.drflac_open_memory(data, len(data), ffi.NULL)
+    flac = lib.drflac_open_memory(ffi.from_buffer(data), len(data), ffi.NULL)
     if not flac:
         raise DecodeError("could not open/decode data")
     try:
@@ -416,7 +415,7 @@ def flac_read_s32(data: bytes) -> DecodedSoundFile:
     with ffi.new("unsigned int *") as channels, \
         ffi.new("unsigned int *") as sample_rate, \
         ffi.new("drflac_uint64 *") as num_frames:
-        memory = lib.drflac_open_memory_and_read_pcm_frames_s32(data, len(data),
+        memory = lib.drflac_open_memory_and_read_pcm_frames_s32(ffi.from_buffer(data), len(data),
                                                                 channels, sample_rate, num_frames, ffi.NULL)
         if not memory:
             raise DecodeError("cannot load/decode data")
@@ -434,7 +433,7 @@ def flac_read_s16(data: bytes) -> DecodedSoundFile:
     with ffi.new("unsigned int *") as channels, \
         ffi.new("unsigned int *") as sample_rate, \
         ffi.new("drflac_uint64 *") as num_frames:
-        memory = lib.drflac_open_memory_and_read_pcm_frames_s16(data, len(data),
+        memory = lib.drflac_open_memory_and_read_pcm_frames_s16(ffi.from_buffer(data), len(data),
                                                                 channels, sample_rate, num_frames, ffi.NULL)
         if not memory:
             raise DecodeError("cannot load/decode data")
@@ -452,7 +451,7 @@ def flac_read_f32(data: bytes) -> DecodedSoundFile:
     with ffi.new("unsigned int *") as channels, \
         ffi.new("unsigned int *") as sample_rate, \
         ffi.new("drflac_uint64 *") as num_frames:
-        memory = lib.drflac_open_memory_and_read_pcm_frames_f32(data, len(data),
+        memory = lib.drflac_open_memory_and_read_pcm_frames_f32(ffi.from_buffer(data), len(data),
                                                                 channels, sample_rate, num_frames, ffi.NULL)
         if not memory:
             raise DecodeError("cannot load/decode data")
@@ -479,15 +478,16 @@ def flac_stream_file(filename: str, frames_to_read: int = 1024,
         if result <= 0:
             raise DecodeError("can't seek")
     try:
-        with ffi.new("drflac_int16[]", frames_to_read * flac.channels) as decodebuffer:
+        frame_size = 2 * flac.channels
+        typecode = _create_int_array(2).typecode
+        with _new_uncleared("drflac_int16[]", frames_to_read * flac.channels) as decodebuffer:
             buf_ptr = ffi.cast("drflac_int16 *", decodebuffer)
             while True:
-                num_samples = lib.drflac_read_pcm_frames_s16(flac, frames_to_read, buf_ptr)
-                if num_samples <= 0:
+                num_frames = lib.drflac_read_pcm_frames_s16(flac, frames_to_read, buf_ptr)
+                if num_frames <= 0:
                     break
-                buffer = ffi.buffer(decodebuffer, num_samples * 2 * flac.channels)
-                samples = _create_int_array(2)
-                samples.frombytes(buffer)
+                samples = array.array(typecode)
+                samples.frombytes(ffi.buffer(decodebuffer, num_frames * frame_size))
                 yield samples
     finally:
         lib.drflac_close(flac)
@@ -496,7 +496,7 @@ def flac_stream_file(filename: str, frames_to_read: int = 1024,
 def mp3_get_file_info(filename: str) -> SoundFileInfo:
     """Fetch some information about the audio file (mp3 format)."""
     filenamebytes = _get_filename_bytes(filename)
-    with ffi.new("drmp3 *") as mp3:
+    with _new_uncleared("drmp3 *") as mp3:
         if not lib.drmp3_init_file(mp3, filenamebytes, ffi.NULL):
             raise DecodeError("could not open/decode file")
         try:
@@ -510,8 +510,8 @@ def mp3_get_file_info(filename: str) -> SoundFileInfo:
 
 def mp3_get_info(data: bytes) -> SoundFileInfo:
     """Fetch some information about the audio data (mp3 format)."""
-    with ffi.new("drmp3 *") as mp3:
-        if not lib.drmp3_init_memory(mp3, data, len(data), ffi.NULL):
+    with _new_uncleared("drmp3 *") as mp3:
+        if not lib.drmp3_init_memory(mp3, ffi.from_buffer(data), len(data), ffi.NULL):
             raise DecodeError("could not open/decode data")
         try:
             num_frames = lib.drmp3_get_pcm_frame_count(mp3)
@@ -557,7 +557,8 @@ def mp3_read_file_s16(filename: str) -> DecodedSoundFile:
 def mp3_read_f32(data: bytes) -> DecodedSoundFile:
     """Reads and decodes the whole mp3 audio data. Resulting sample format is 32 bits float."""
     with ffi.new("drmp3_config *") as config, ffi.new("drmp3_uint64 *") as num_frames:
-        memory = lib.drmp3_open_memory_and_read_pcm_frames_f32(data, len(data), config, num_frames, ffi.NULL)
+        memory = lib.drmp3_open_memory_and_read_pcm_frames_f32(ffi.from_buffer(data), len(data),
+                                                               config, num_frames, ffi.NULL)
         if not memory:
             raise DecodeError("cannot load/decode data")
         try:
@@ -572,7 +573,8 @@ def mp3_read_f32(data: bytes) -> DecodedSoundFile:
 def mp3_read_s16(data: bytes) -> DecodedSoundFile:
     """Reads and decodes the whole mp3 audio data. Resulting sample format is 16 bits signed integer."""
     with ffi.new("drmp3_config *") as config, ffi.new("drmp3_uint64 *") as num_frames:
-        memory = lib.drmp3_open_memory_and_read_pcm_frames_s16(data, len(data), config, num_frames, ffi.NULL)
+        memory = lib.drmp3_open_memory_and_read_pcm_frames_s16(ffi.from_buffer(data), len(data),
+                                                               config, num_frames, ffi.NULL)
         if not memory:
             raise DecodeError("cannot load/decode data")
         try:
@@ -589,7 +591,7 @@ def mp3_stream_file(filename: str, frames_to_read: int = 1024, seek_frame: int =
     This uses a fixed chunk size and cannot be used as a generic miniaudio decoder input stream.
     Consider using stream_file() instead."""
     filenamebytes = _get_filename_bytes(filename)
-    with ffi.new("drmp3 *") as mp3:
+    with _new_uncleared("drmp3 *") as mp3:
         if not lib.drmp3_init_file(mp3, filenamebytes, ffi.NULL):
             raise DecodeError("could not open/decode file")
         if seek_frame > 0:
@@ -597,15 +599,16 @@ def mp3_stream_file(filename: str, frames_to_read: int = 1024, seek_frame: int =
             if result <= 0:
                 raise DecodeError("can't seek")
         try:
-            with ffi.new("drmp3_int16[]", frames_to_read * mp3.channels) as decodebuffer:
+            frame_size = 2 * mp3.channels
+            typecode = _create_int_array(2).typecode
+            with _new_uncleared("drmp3_int16[]", frames_to_read * mp3.channels) as decodebuffer:
                 buf_ptr = ffi.cast("drmp3_int16 *", decodebuffer)
                 while True:
-                    num_samples = lib.drmp3_read_pcm_frames_s16(mp3, frames_to_read, buf_ptr)
-                    if num_samples <= 0:
+                    num_frames = lib.drmp3_read_pcm_frames_s16(mp3, frames_to_read, buf_ptr)
+                    if num_frames <= 0:
                         break
-                    buffer = ffi.buffer(decodebuffer, num_samples * 2 * mp3.channels)
-                    samples = _create_int_array(2)
-                    samples.frombytes(buffer)
+                    samples = array.array(typecode)
+                    samples.frombytes(ffi.buffer(decodebuffer, num_frames * frame_size))
                     yield samples
         finally:
             lib.drmp3_uninit(mp3)
@@ -614,7 +617,7 @@ def mp3_stream_file(filename: str, frames_to_read: int = 1024, seek_frame: int =
 def wav_get_file_info(filename: str) -> SoundFileInfo:
     """Fetch some information about the audio file (wav format)."""
     filenamebytes = _get_filename_bytes(filename)
-    with ffi.new("drwav*") as wav:
+    with _new_uncleared("drwav *") as wav:
         if not lib.drwav_init_file(wav, filenamebytes, ffi.NULL):
             raise DecodeError("could not open/decode file")
         try:
@@ -629,8 +632,8 @@ def wav_get_file_info(filename: str) -> SoundFileInfo:
 
 def wav_get_info(data: bytes) -> SoundFileInfo:
     """Fetch some information about the audio data (wav format)."""
-    with ffi.new("drwav*") as wav:
-        if not lib.drwav_init_memory(wav, data, len(data), ffi.NULL):
+    with _new_uncleared("drwav *") as wav:
+        if not lib.drwav_init_memory(wav, ffi.from_buffer(data), len(data), ffi.NULL):
             raise DecodeError("could not open/decode data")
         try:
             duration = wav.totalPCMFrameCount / wav.sampleRate
@@ -701,7 +704,8 @@ def wav_read_s32(data: bytes) -> DecodedSoundFile:
     with ffi.new("unsigned int *") as channels, \
         ffi.new("unsigned int *") as sample_rate, \
         ffi.new("drwav_uint64 *") as num_frames:
-        memory = lib.drwav_open_memory_and_read_pcm_frames_s32(data, len(data), channels, sample_rate, num_frames, ffi.NULL)
+        memory = lib.drwav_open_memory_and_read_pcm_frames_s32(ffi.from_buffer(data), len(data),
+                                                               channels, sample_rate, num_frames, ffi.NULL)
         if not memory:
             raise DecodeError("cannot load/decode data")
         try:
@@ -718,7 +722,8 @@ def wav_read_s16(data: bytes) -> DecodedSoundFile:
     with ffi.new("unsigned int *") as channels, \
         ffi.new("unsigned int *") as sample_rate, \
         ffi.new("drwav_uint64 *") as num_frames:
-        memory = lib.drwav_open_memory_and_read_pcm_frames_s16(data, len(data), channels, sample_rate, num_frames, ffi.NULL)
+        memory = lib.drwav_open_memory_and_read_pcm_frames_s16(ffi.from_buffer(data), len(data),
+                                                               channels, sample_rate, num_frames, ffi.NULL)
         if not memory:
             raise DecodeError("cannot load/decode data")
         try:
@@ -735,7 +740,8 @@ def wav_read_f32(data: bytes) -> DecodedSoundFile:
     with ffi.new("unsigned int *") as channels, \
         ffi.new("unsigned int *") as sample_rate, \
         ffi.new("drwav_uint64 *") as num_frames:
-        memory = lib.drwav_open_memory_and_read_pcm_frames_f32(data, len(data), channels, sample_rate, num_frames, ffi.NULL)
+        memory = lib.drwav_open_memory_and_read_pcm_frames_f32(ffi.from_buffer(data), len(data),
+                                                               channels, sample_rate, num_frames, ffi.NULL)
         if not memory:
             raise DecodeError("cannot load/decode data")
         try:
@@ -753,7 +759,7 @@ def wav_stream_file(filename: str, frames_to_read: int = 1024,
     This uses a fixed chunk size and cannot be used as a generic miniaudio decoder input stream.
     Consider using stream_file() instead."""
     filenamebytes = _get_filename_bytes(filename)
-    with ffi.new("drwav*") as wav:
+    with _new_uncleared("drwav *") as wav:
         if not lib.drwav_init_file(wav, filenamebytes, ffi.NULL):
             raise DecodeError("could not open/decode file")
         if seek_frame > 0:
@@ -761,15 +767,16 @@ def wav_stream_file(filename: str, frames_to_read: int = 1024,
             if result <= 0:
                 raise DecodeError("can't seek")
         try:
-            with ffi.new("drwav_int16[]", frames_to_read * wav.channels) as decodebuffer:
+            frame_size = 2 * wav.channels
+            typecode = _create_int_array(2).typecode
+            with _new_uncleared("drwav_int16[]", frames_to_read * wav.channels) as decodebuffer:
                 buf_ptr = ffi.cast("drwav_int16 *", decodebuffer)
                 while True:
-                    num_samples = lib.drwav_read_pcm_frames_s16(wav, frames_to_read, buf_ptr)
-                    if num_samples <= 0:
+                    num_frames = lib.drwav_read_pcm_frames_s16(wav, frames_to_read, buf_ptr)
+                    if num_frames <= 0:
                         break
-                    buffer = ffi.buffer(decodebuffer, num_samples * 2 * wav.channels)
-                    samples = _create_int_array(2)
-                    samples.frombytes(buffer)
+                    samples = array.array(typecode)
+                    samples.frombytes(ffi.buffer(decodebuffer, num_frames * frame_size))
                     yield samples
         finally:
             lib.drwav_uninit(wav)
@@ -777,7 +784,7 @@ def wav_stream_file(filename: str, frames_to_read: int = 1024,
 
 def wav_write_file(filename: str, sound: DecodedSoundFile) -> None:
     """Writes the pcm sound to a WAV file"""
-    with ffi.new("drwav_data_format*") as fmt, ffi.new("drwav*") as pwav:
+    with ffi.new("drwav_data_format*") as fmt, _new_uncleared("drwav *") as pwav:
         fmt.container = lib.drwav_container_riff
         fmt.format = lib.DR_WAVE_FORMAT_PCM
         fmt.channels = sound.nchannels
@@ -789,7 +796,7 @@ def wav_write_file(filename: str, sound: DecodedSoundFile) -> None:
                                                     fmt, sound.num_frames * sound.nchannels, ffi.NULL):
             raise IOError("can't open file for writing")
         try:
-            lib.drwav_write_pcm_frames(pwav, sound.num_frames, sound.samples.tobytes())
+            lib.drwav_write_pcm_frames(pwav, sound.num_frames, ffi.from_buffer(sound.samples))
         finally:
             lib.drwav_uninit(pwav)
 
@@ -881,30 +888,35 @@ class Devices:
         lib.ma_context_uninit(self._context)
 
 
+_format_widths = {
+    SampleFormat.UNSIGNED8: 1,
+    SampleFormat.SIGNED16: 2,
+    SampleFormat.SIGNED24: 3,
+    SampleFormat.SIGNED32: 4,
+    SampleFormat.FLOAT32: 4
+}
+
+_format_typecodes = {
+    SampleFormat.UNSIGNED8: _create_int_array(1).typecode,
+    SampleFormat.SIGNED16: _create_int_array(2).typecode,
+    SampleFormat.SIGNED32: _create_int_array(4).typecode,
+    SampleFormat.FLOAT32: 'f'
+}
+
+
 def _width_from_format(sampleformat: SampleFormat) -> int:
-    widths = {
-        SampleFormat.UNSIGNED8: 1,
-        SampleFormat.SIGNED16: 2,
-        SampleFormat.SIGNED24: 3,
-        SampleFormat.SIGNED32: 4,
-        SampleFormat.FLOAT32: 4
-    }
-    if sampleformat in widths:
-        return widths[sampleformat]
-    raise MiniaudioError("unsupported sample format", sampleformat)
+    try:
+        return _format_widths[sampleformat]
+    except KeyError:
+        raise MiniaudioError("unsupported sample format", sampleformat) from None
 
 
 def _array_proto_from_format(sampleformat: SampleFormat) -> array.array:
-    arrays = {
-        SampleFormat.UNSIGNED8: _create_int_array(1),
-        SampleFormat.SIGNED16: _create_int_array(2),
-        SampleFormat.SIGNED32: _create_int_array(4),
-        SampleFormat.FLOAT32: array.array('f')
-    }
-    if sampleformat in arrays:
-        return arrays[sampleformat]
-    raise MiniaudioError("the requested sample format can not be used directly: "
-                         + sampleformat.name + " (convert it first)")
+    try:
+        return array.array(_format_typecodes[sampleformat])
+    except KeyError:
+        raise MiniaudioError("the requested sample format can not be used directly: "
+                             + sampleformat.name + " (convert it first)") from None
 
 
 def _format_from_width(sample_width: int, is_float: bool = False) -> SampleFormat:
@@ -922,6 +934,37 @@ def _format_from_width(sample_width: int, is_float: bool = False) -> SampleForma
         raise MiniaudioError("unsupported sample width", sample_width)
 
 
+def _detect_format(data: bytes) -> FileFormat:
+    # recognise the audio file format from the first few bytes of the data
+    header = bytes(memoryview(data)[:4])
+    if header in (b"RIFF", b"RIFX", b"riff"):
+        return FileFormat.WAV
+    elif header == b"fLaC":
+        return FileFormat.FLAC
+    elif header == b"OggS":
+        return FileFormat.VORBIS
+    elif header[:3] == b"ID3" or (len(header) >= 2 and header[0] == 0xff and header[1] & 0xe0 == 0xe0):
+        return FileFormat.MP3
+    return FileFormat.UNKNOWN
+
+
+def _decoder_init_memory(databuffer: ffi.CData, decoder_config: ffi.CData, decoder: ffi.CData) -> int:
+    # init the decoder directly for the detected file format, to avoid trying all decoders one by one.
+    # the decoder keeps reading from the memory of databuffer, so the caller must keep it alive.
+    data = ffi.buffer(databuffer)
+    decoder_init = {
+        FileFormat.WAV: lib.ma_decoder_init_memory_wav,
+        FileFormat.FLAC: lib.ma_decoder_init_memory_flac,
+        FileFormat.VORBIS: lib.ma_decoder_init_memory_vorbis,
+        FileFormat.MP3: lib.ma_decoder_init_memory_mp3
+    }.get(_detect_format(data))
+    if decoder_init:
+        result = decoder_init(databuffer, len(data), ffi.addressof(decoder_config), decoder)
+        if result == lib.MA_SUCCESS:
+            return result
+    return lib.ma_decoder_init_memory(databuffer, len(data), ffi.addressof(decoder_config), decoder)
+
+
 def decode_file(filename: str, output_format: SampleFormat = SampleFormat.SIGNED16,
                 nchannels: int = 2, sample_rate: int = 44100, dither: DitherMode = DitherMode.NONE) -> DecodedSoundFile:
     """Convenience function to decode any supported audio file to raw PCM samples in your chosen format."""
@@ -948,7 +991,7 @@ def decode(data: bytes, output_format: SampleFormat = SampleFormat.SIGNED16,
     with ffi.new("ma_uint64 *") as frames, ffi.new("void **") as memory:
         decoder_config = lib.ma_decoder_config_init(output_format.value, nchannels, sample_rate)
         decoder_config.ditherMode = dither.value
-        result = lib.ma_decode_memory(data, len(data), ffi.addressof(decoder_config), frames, memory)
+        result = lib.ma_decode_memory(ffi.from_buffer(data), len(data), ffi.addressof(decoder_config), frames, memory)
         if result != lib.MA_SUCCESS:
             raise DecodeError("failed to decode data", result)
         buffer = ffi.buffer(memory[0], frames[0] * nchannels * sample_width)
@@ -961,28 +1004,33 @@ def _samples_stream_generator(frames_to_read: int, nchannels: int, output_format
                               decoder: ffi.CData, data: Any,
                               on_close: Optional[Callable] = None) -> Generator[array.array, int, None]:
     _reference = data    # make sure any data passed in is not garbage collected
-    sample_width = _width_from_format(output_format)
+    frame_size = _width_from_format(output_format) * nchannels
     samples_proto = _array_proto_from_format(output_format)
+    typecode = samples_proto.typecode
     allocated_buffer_frames = max(frames_to_read, 16384)
+    # local names for the functions used in the loop, to avoid repeated attribute lookups per chunk
+    read_pcm_frames = lib.ma_decoder_read_pcm_frames
+    ffi_buffer = ffi.buffer
+    new_array = array.array
     try:
-        with ffi.new("int8_t[]", allocated_buffer_frames * nchannels * sample_width) as decodebuffer:
+        with ffi.new("int8_t[]", allocated_buffer_frames * frame_size) as decodebuffer:
             buf_ptr = ffi.cast("void *", decodebuffer)
             want_frames = (yield samples_proto) or frames_to_read
             while True:
                 if want_frames > allocated_buffer_frames:
                     raise MiniaudioError("wanted to read more frames than storage was allocated for ({} vs {})"
                                          .format(want_frames, allocated_buffer_frames))
-                num_frames = lib.ma_decoder_read_pcm_frames(decoder, buf_ptr, want_frames)
+                num_frames = read_pcm_frames(decoder, buf_ptr, want_frames)
                 if num_frames <= 0:
                     break
-                buffer = ffi.buffer(decodebuffer, num_frames * sample_width * nchannels)
-                samples = array.array(samples_proto.typecode)
-                samples.frombytes(buffer)
+                samples = new_array(typecode)
+                samples.frombytes(ffi_buffer(decodebuffer, num_frames * frame_size))
                 want_frames = (yield samples) or frames_to_read
     finally:
         if on_close:
             on_close()
         lib.ma_decoder_uninit(decoder)
+        ffi.release(decoder)
 
 
 def stream_file(filename: str, output_format: SampleFormat = SampleFormat.SIGNED16, nchannels: int = 2,
@@ -997,7 +1045,7 @@ def stream_file(filename: str, output_format: SampleFormat = SampleFormat.SIGNED
     wants a variable number of frames per call.
     """
     filenamebytes = _get_filename_bytes(filename)
-    decoder = ffi.new("ma_decoder *")
+    decoder = _new_uncleared("ma_decoder *")
     decoder_config = lib.ma_decoder_config_init(output_format.value, nchannels, sample_rate)
     decoder_config.ditherMode = dither.value
     result = lib.ma_decoder_init_file(filenamebytes, ffi.addressof(decoder_config), decoder)
@@ -1006,6 +1054,7 @@ def stream_file(filename: str, output_format: SampleFormat = SampleFormat.SIGNED
     if seek_frame > 0:
         result = lib.ma_decoder_seek_to_pcm_frame(decoder, seek_frame)
         if result != lib.MA_SUCCESS:
+            lib.ma_decoder_uninit(decoder)
             raise DecodeError("failed to seek to frame", result)
     g = _samples_stream_generator(frames_to_read, nchannels, output_format, decoder, None)
     dummy = next(g)
@@ -1024,18 +1073,121 @@ def stream_memory(data: bytes, output_format: SampleFormat = SampleFormat.SIGNED
     This is particularly useful to plug this stream into an audio device callback that
     wants a variable number of frames per call.
     """
-    decoder = ffi.new("ma_decoder *")
+    decoder = _new_uncleared("ma_decoder *")
     decoder_config = lib.ma_decoder_config_init(output_format.value, nchannels, sample_rate)
     decoder_config.ditherMode = dither.value
-    result = lib.ma_decoder_init_memory(data, len(data), ffi.addressof(decoder_config), decoder)
+    databuffer = ffi.from_buffer(data)
+    result = _decoder_init_memory(databuffer, decoder_config, decoder)
     if result != lib.MA_SUCCESS:
         raise DecodeError("failed to init decoder", result)
-    g = _samples_stream_generator(frames_to_read, nchannels, output_format, decoder, data)
+    g = _samples_stream_generator(frames_to_read, nchannels, output_format, decoder, databuffer)
     dummy = next(g)
     assert len(dummy) == 0
     return g
 
 
+class Decoder:
+    """
+    Decoder for any supported audio file (given by its filename) or audio file data in memory,
+    that produces raw PCM samples in the chosen format. Can be used as a contextmanager, to properly call close().
+    Unlike the stream functions, you can also decode directly into your own (reusable) buffer with read_into().
+    Use SampleFormat.UNKNOWN, 0 channels and/or sample rate 0 to keep the file's own format, channels and rate,
+    which avoids any conversion work. The actual output format is available in the attributes afterwards.
+    """
+    def __init__(self, source: Union[str, bytes], output_format: SampleFormat = SampleFormat.SIGNED16,
+                 nchannels: int = 2, sample_rate: int = 44100, dither: DitherMode = DitherMode.NONE) -> None:
+        self._decoder = None
+        self._data = None
+        decoder = _new_uncleared("ma_decoder *")
+        decoder_config = lib.ma_decoder_config_init(output_format.value, nchannels, sample_rate)
+        decoder_config.ditherMode = dither.value
+        if isinstance(source, str):
+            filenamebytes = _get_filename_bytes(source)
+            result = lib.ma_decoder_init_file(filenamebytes, ffi.addressof(decoder_config), decoder)
+        else:
+            self._data = ffi.from_buffer(source)    # the decoder reads directly from this memory, keep it alive
+            result = _decoder_init_memory(self._data, decoder_config, decoder)
+        if result != lib.MA_SUCCESS:
+            self.close()
+            raise DecodeError("failed to init decoder", result)
+        self._decoder = decoder
+        self.output_format = SampleFormat(decoder.outputFormat)
+        self.nchannels = decoder.outputChannels
+        self.sample_rate = decoder.outputSampleRate
+        self.sample_width = _width_from_format(self.output_format)
+        self._frame_size = self.sample_width * self.nchannels
+
+    def __enter__(self) -> "Decoder":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        self.close()
+
+    @property
+    def num_frames(self) -> int:
+        """The total number of pcm frames in the decoded output (0 if this is unknown)."""
+        if not self._decoder:
+            raise MiniaudioError("decoder is closed")
+        return lib.ma_decoder_get_length_in_pcm_frames(self._decoder)
+
+    def read(self, num_frames: int) -> array.array:
+        """Read up to the given number of frames, returned as a new array of samples (empty at the end)."""
+        samples = _array_proto_from_format(self.output_format)
+        buffer = bytearray(num_frames * self._frame_size)
+        frames_read = self.read_into(buffer)
+        samples.frombytes(memoryview(buffer)[:frames_read * self._frame_size])
+        return samples
+
+    def read_into(self, buffer: Any, loop: bool = False) -> int:
+        """
+        Decode frames directly into the given writable contiguous buffer (such as a bytearray,
+        array.array or numpy array of the decoder's sample format), without an intermediate copy.
+        As many frames as will fit in the buffer are read. Returns the number of frames actually read.
+        If loop is True, decoding continues from the start when the end of the stream is reached,
+        so the buffer is always filled completely (unless the stream is empty).
+        """
+        if not self._decoder:
+            raise MiniaudioError("decoder is closed")
+        target = ffi.from_buffer(buffer, require_writable=True)
+        num_frames = len(target) // self._frame_size
+        return lib.pyma_decoder_read(self._decoder, target, num_frames, loop)
+
+    def read_planar_into(self, buffer: Any) -> int:
+        """
+        Decode frames directly into the given writable contiguous buffer, but with the channels stored
+        one after another instead of interleaved (such as a numpy array of shape (nchannels, frames)).
+        Each channel gets an equal part of the buffer. Returns the number of frames actually read.
+        """
+        if not self._decoder:
+            raise MiniaudioError("decoder is closed")
+        target = ffi.from_buffer(buffer, require_writable=True)
+        num_frames = len(target) // self._frame_size
+        plane_size = num_frames * self.sample_width
+        planes = ffi.new("void*[]", [target + channel * plane_size for channel in range(self.nchannels)])
+        return lib.pyma_decoder_read_planar(self._decoder, planes, num_frames)
+
+    def seek(self, frame: int) -> None:
+        """Seek to the given pcm frame in the decoded output."""
+        if not self._decoder:
+            raise MiniaudioError("decoder is closed")
+        result = lib.ma_decoder_seek_to_pcm_frame(self._decoder, frame)
+        if result != lib.MA_SUCCESS:
+            raise DecodeError("failed to seek to frame", result)
+
+    def close(self) -> None:
+        """Close the decoder and free its resources."""
+        if self._decoder:
+            lib.ma_decoder_uninit(self._decoder)
+            ffi.release(self._decoder)
+            self._decoder = None
+        if self._data is not None:
+            ffi.release(self._data)     # give up our export of the source buffer
+            self._data = None
+
+
 class StreamableSource(abc.ABC):
     """Base class for streams of audio data bytes. Can be used as a contextmanager, to properly call close()."""
     ffi_handle = ffi.NULL       # can be set later
@@ -1045,6 +1197,17 @@ class StreamableSource(abc.ABC):
         """override this to provide data bytes to the consumer of the stream"""
         pass
 
+    def readinto(self, buffer: memoryview) -> int:
+        """
+        Read data bytes directly into the given buffer and return the number of bytes read.
+        The default implementation uses read(). Override this if the data can be put directly
+        into the buffer (for instance via a buffered file's readinto), to avoid a copy per read.
+        """
+        data = self.read(len(buffer))
+        num_bytes = len(data)
+        buffer[:num_bytes] = data
+        return num_bytes
+
     def seek(self, offset: int, origin: SeekOrigin) -> bool:
         """
         Override this if the stream supports seeking.
@@ -1181,7 +1344,7 @@ def stream_any(source: StreamableSource, source_format: FileFormat = FileFormat.
     This is particularly useful to plug this stream into an audio device callback that
     wants a variable number of frames per call.
     """
-    decoder = ffi.new("ma_decoder *")
+    decoder = _new_uncleared("ma_decoder *")
     decoder_config = lib.ma_decoder_config_init(output_format.value, nchannels, sample_rate)
     decoder_config.ditherMode = dither.value
     source.ffi_handle = ffi.new_handle(source)
@@ -1199,6 +1362,7 @@ def stream_any(source: StreamableSource, source_format: FileFormat = FileFormat.
     if seek_frame > 0:
         result = lib.ma_decoder_seek_to_pcm_frame(decoder, seek_frame)
         if result != lib.MA_SUCCESS:
+            lib.ma_decoder_uninit(decoder)
             raise DecodeError("failed to seek to frame", result)
 
     def on_close() -> None:
@@ -1215,9 +1379,7 @@ def _internal_decoder_read_callback(decoder: ffi.CData, output: ffi.CData, num_b
     if num_bytes <= 0 or not decoder.pUserData:
         return 0
     source = ffi.from_handle(decoder.pUserData)
-    data = source.read(num_bytes)
-    ffi.memmove(output, data, len(data))
-    return len(data)
+    return source.readinto(memoryview(ffi.buffer(output, num_bytes)))
 
 
 @ffi.def_extern()
@@ -1234,34 +1396,205 @@ def convert_sample_format(from_fmt: SampleFormat, sourcedata: bytes, to_fmt: Sam
                           dither: DitherMode = DitherMode.NONE) -> bytearray:
     """Convert a raw buffer of pcm samples to another sample format.
     The result is returned as another raw pcm sample buffer"""
-    sample_width = _width_from_format(from_fmt)
-    num_samples = len(sourcedata) // sample_width
-    sample_width = _width_from_format(to_fmt)
-    buffer = bytearray(sample_width * num_samples)
-    lib.ma_pcm_convert(ffi.from_buffer(buffer), to_fmt.value, sourcedata, from_fmt.value, num_samples, dither.value)
+    source = memoryview(sourcedata).cast("B")
+    num_samples = len(source) // _width_from_format(from_fmt)
+    buffer = bytearray(_width_from_format(to_fmt) * num_samples)
+    convert_sample_format_into(from_fmt, source, to_fmt, buffer, dither)
     return buffer
 
 
+def convert_sample_format_into(from_fmt: SampleFormat, sourcedata: Any, to_fmt: SampleFormat, target: Any,
+                               dither: DitherMode = DitherMode.NONE) -> int:
+    """
+    Convert a buffer of pcm samples to another sample format, directly into the given writable target buffer.
+    Source and target can be any contiguous buffer such as bytes, bytearray, array.array or a numpy array,
+    their element size must be 1 byte or match the sample width. Returns the number of samples converted.
+    """
+    source = memoryview(sourcedata)
+    output = memoryview(target)
+    from_width = _width_from_format(from_fmt)
+    to_width = _width_from_format(to_fmt)
+    if source.itemsize not in (1, from_width) or output.itemsize not in (1, to_width):
+        raise MiniaudioError("buffer element size doesn't match the sample format")
+    num_samples = source.nbytes // from_width
+    if output.nbytes < num_samples * to_width:
+        raise MiniaudioError("target buffer too small")
+    source_ptr = ffi.from_buffer(source)
+    output_ptr = ffi.from_buffer(output, require_writable=True)
+    if dither == DitherMode.NONE:
+        if from_fmt == SampleFormat.SIGNED16 and to_fmt == SampleFormat.FLOAT32:
+            lib.pyma_s16_to_f32(ffi.cast("float*", output_ptr), ffi.cast("int16_t*", source_ptr), num_samples)
+            return num_samples
+        if from_fmt == SampleFormat.FLOAT32 and to_fmt == SampleFormat.SIGNED16:
+            lib.pyma_f32_to_s16(ffi.cast("int16_t*", output_ptr), ffi.cast("float*", source_ptr), num_samples)
+            return num_samples
+        if from_fmt == SampleFormat.SIGNED16 and to_fmt == SampleFormat.UNSIGNED8:
+            lib.pyma_s16_to_u8(ffi.cast("ma_uint8*", output_ptr), ffi.cast("int16_t*", source_ptr), num_samples)
+            return num_samples
+    elif from_fmt == SampleFormat.FLOAT32 and to_fmt == SampleFormat.SIGNED16:
+        dither_state = ffi.from_buffer("ma_uint32[]", bytearray(os.urandom(32)))
+        lib.pyma_f32_to_s16_dither(ffi.cast("int16_t*", output_ptr), ffi.cast("float*", source_ptr), num_samples,
+                                   dither.value, dither_state)
+        return num_samples
+    lib.ma_pcm_convert(output_ptr, to_fmt.value, source_ptr, from_fmt.value, num_samples, dither.value)
+    return num_samples
+
+
 def convert_frames(from_fmt: SampleFormat, from_numchannels: int, from_samplerate: int, sourcedata: bytes,
                    to_fmt: SampleFormat, to_numchannels: int, to_samplerate: int) -> bytearray:
     """Convert audio frames in source sample format with a certain number of channels,
     to another sample format and possibly down/upmixing the number of channels as well."""
     sample_width = _width_from_format(from_fmt)
-    num_frames = int(len(sourcedata) / from_numchannels / sample_width)
+    num_frames = len(memoryview(sourcedata).cast("B")) // (from_numchannels * sample_width)
     sample_width = _width_from_format(to_fmt)
     output_frame_count = lib.ma_calculate_frame_count_after_resampling(to_samplerate, from_samplerate, num_frames)
     buffer = bytearray(output_frame_count * sample_width * to_numchannels)
+    convert_frames_into(from_fmt, from_numchannels, from_samplerate, sourcedata,
+                        to_fmt, to_numchannels, to_samplerate, buffer)
+    return buffer
+
+
+def convert_frames_into(from_fmt: SampleFormat, from_numchannels: int, from_samplerate: int, sourcedata: Any,
+                        to_fmt: SampleFormat, to_numchannels: int, to_samplerate: int, target: Any) -> int:
+    """
+    Like convert_frames() but writes the converted frames directly into the given writable target buffer,
+    such as a bytearray, array.array or numpy array. Source and target are used as-is without copying.
+    At most as many frames as fit in the target are written. Returns the number of frames converted.
+    """
+    source = memoryview(sourcedata).cast("B")
+    output = memoryview(target).cast("B")
+    num_frames = len(source) // (from_numchannels * _width_from_format(from_fmt))
+    output_frame_count = len(output) // (to_numchannels * _width_from_format(to_fmt))
     # note: the API doesn't have an option here to specify the dither mode.
-    lib.ma_convert_frames(ffi.from_buffer(buffer), output_frame_count, to_fmt.value, to_numchannels, to_samplerate,
-                          sourcedata, num_frames, from_fmt.value, from_numchannels, from_samplerate)
+    return lib.ma_convert_frames(ffi.from_buffer(output, require_writable=True), output_frame_count,
+                                 to_fmt.value, to_numchannels, to_samplerate,
+                                 ffi.from_buffer(source), num_frames, from_fmt.value, from_numchannels, from_samplerate)
+
+
+def resample_f32(samples: Union[bytes, array.array], nchannels: int, from_samplerate: int, to_samplerate: int,
+                 hermite: bool = False) -> array.array:
+    """
+    Quickly resample float32 pcm frames to another sample rate, using linear or 4-point Hermite interpolation.
+    This does no low-pass filtering, so use convert_frames() instead for high quality downsampling.
+    The result is returned as a new array of float32 samples.
+    """
+    source = memoryview(samples).cast("B")
+    num_frames = len(source) // (4 * nchannels)
+    output_frame_count = lib.ma_calculate_frame_count_after_resampling(to_samplerate, from_samplerate, num_frames)
+    result = array.array('f', bytes(output_frame_count * nchannels * 4))
+    lib.pyma_resample_f32(ffi.cast("float*", ffi.from_buffer(source)), num_frames, nchannels,
+                          ffi.from_buffer("float[]", result), output_frame_count,
+                          from_samplerate / to_samplerate, hermite)
+    return result
+
+
+def interleave_channels(sample_format: SampleFormat, channels: List[Union[bytes, array.array]]) -> bytearray:
+    """Interleave separate buffers of pcm samples, one per channel, into a single buffer of frames."""
+    if not channels:
+        raise ValueError("need at least one channel")
+    sample_width = _width_from_format(sample_format)
+    channel_bufs = [memoryview(channel).cast("B") for channel in channels]
+    num_bytes = len(channel_bufs[0])
+    if any(len(buf) != num_bytes for buf in channel_bufs):
+        raise ValueError("all channels must have the same length")
+    num_frames = num_bytes // sample_width
+    buffer = bytearray(num_frames * sample_width * len(channels))
+    if len(channels) == 2 and sample_format in (SampleFormat.FLOAT32, SampleFormat.SIGNED16):
+        left = ffi.from_buffer(channel_bufs[0])
+        right = ffi.from_buffer(channel_bufs[1])
+        if sample_format == SampleFormat.FLOAT32:
+            lib.pyma_interleave_stereo_f32(ffi.cast("float*", left), ffi.cast("float*", right),
+                                           ffi.from_buffer("float[]", buffer), num_frames)
+        else:
+            lib.pyma_interleave_stereo_s16(ffi.cast("int16_t*", left), ffi.cast("int16_t*", right),
+                                           ffi.from_buffer("int16_t[]", buffer), num_frames)
+    else:
+        sources = [ffi.from_buffer(buf) for buf in channel_bufs]
+        channel_ptrs = ffi.new("void*[]", [ffi.cast("void*", src) for src in sources])
+        lib.ma_interleave_pcm_frames(sample_format.value, len(channels), num_frames, channel_ptrs,
+                                     ffi.from_buffer(buffer))
     return buffer
 
 
+def deinterleave_channels(sample_format: SampleFormat, nchannels: int, frames: bytes) -> List[bytearray]:
+    """Split a buffer of interleaved pcm frames into separate buffers, one per channel."""
+    sample_width = _width_from_format(sample_format)
+    source = memoryview(frames).cast("B")
+    num_frames = len(source) // (sample_width * nchannels)
+    buffers = [bytearray(num_frames * sample_width) for _ in range(nchannels)]
+    if nchannels == 2 and sample_format == SampleFormat.FLOAT32:
+        lib.pyma_deinterleave_stereo_f32(ffi.from_buffer("float[]", source), ffi.from_buffer("float[]", buffers[0]),
+                                         ffi.from_buffer("float[]", buffers[1]), num_frames)
+    elif nchannels == 2 and sample_format == SampleFormat.SIGNED16:
+        lib.pyma_deinterleave_stereo_s16(ffi.from_buffer("int16_t[]", source),
+                                         ffi.from_buffer("int16_t[]", buffers[0]),
+                                         ffi.from_buffer("int16_t[]", buffers[1]), num_frames)
+    else:
+        targets = [ffi.from_buffer(buf) for buf in buffers]
+        channel_ptrs = ffi.new("void*[]", [ffi.cast("void*", target) for target in targets])
+        lib.ma_deinterleave_pcm_frames(sample_format.value, nchannels, num_frames, ffi.from_buffer(source),
+                                       channel_ptrs)
+    return buffers
+
+
+def calculate_levels(sample_format: SampleFormat, samples: Union[bytes, array.array]) -> Tuple[float, float]:
+    """
+    Calculate the peak and RMS level of a buffer of float32 or signed16 pcm samples, in a single pass.
+    Both levels are returned as (peak, rms), normalized to the range 0.0 - 1.0. Channels are not separated.
+    """
+    buf = memoryview(samples).cast("B")
+    if sample_format == SampleFormat.FLOAT32:
+        num_samples = len(buf) // 4
+        if num_samples == 0:
+            return 0.0, 0.0
+        peak = ffi.new("float*")
+        sumsquares = ffi.new("double*")
+        lib.pyma_levels_f32(ffi.cast("float*", ffi.from_buffer(buf)), num_samples, peak, sumsquares)
+        return peak[0], (sumsquares[0] / num_samples) ** 0.5
+    elif sample_format == SampleFormat.SIGNED16:
+        num_samples = len(buf) // 2
+        if num_samples == 0:
+            return 0.0, 0.0
+        peak_s16 = ffi.new("int32_t*")
+        sumsquares_s16 = ffi.new("int64_t*")
+        lib.pyma_levels_s16(ffi.cast("int16_t*", ffi.from_buffer(buf)), num_samples, peak_s16, sumsquares_s16)
+        return peak_s16[0] / 32768, (sumsquares_s16[0] / num_samples) ** 0.5 / 32768
+    else:
+        raise MiniaudioError("can only calculate levels for float32 or signed16 samples")
+
+
+def as_numpy_array(data: Any, sample_format: SampleFormat, nchannels: int, num_frames: int = 0) -> Any:
+    """
+    Return a numpy array view with shape (numframes, numchannels) on the given pcm frames, without copying.
+    The data can be any buffer (bytes, bytearray, memoryview, array.array) or a cffi pointer, which
+    then also requires the number of frames. The array can be passed directly to numeric code that
+    is JIT-compiled with numba (@numba.njit), to do fast sample processing in Python. Requires numpy.
+    """
+    if not numpy:
+        raise MiniaudioError("numpy is required for this")
+    dtypes = {
+        SampleFormat.UNSIGNED8: numpy.uint8,
+        SampleFormat.SIGNED16: numpy.int16,
+        SampleFormat.SIGNED32: numpy.int32,
+        SampleFormat.FLOAT32: numpy.float32
+    }
+    if sample_format not in dtypes:
+        raise MiniaudioError("the requested sample format can not be used directly: "
+                             + sample_format.name + " (convert it first)")
+    if isinstance(data, ffi.CData):
+        data = ffi.buffer(data, num_frames * nchannels * _width_from_format(sample_format))
+    return numpy.frombuffer(data, dtype=dtypes[sample_format]).reshape(-1, nchannels)
+
+
 @ffi.def_extern()
 def _internal_data_callback(device: ffi.CData, output: ffi.CData, input: ffi.CData, framecount: int) -> None:
     if framecount <= 0 or not device.pUserData:
         return
     callback_device = ffi.from_handle(device.pUserData)
+    if not callback_device._audio_thread_setup:
+        # this runs on miniaudio's audio thread, which stays the same for the lifetime of the device
+        lib.pyma_flush_denormals()
+        callback_device._audio_thread_setup = True
     callback_device._data_callback(device, output, input, framecount)
 
 
@@ -1277,6 +1610,7 @@ class AbstractDevice:
     def __init__(self):
         self.callback_generator = None          # type: Optional[GeneratorTypes]
         self.running = False
+        self._audio_thread_setup = False
         self._device = ffi.new("ma_device *")
 
     def __del__(self) -> None:
@@ -1430,10 +1764,8 @@ class PlaybackDevice(AbstractDevice):
         self._devconfig.playback.format = self.format.value
         self._devconfig.playback.pDeviceID = device_id or ffi.NULL
         self._devconfig.periodSizeInMilliseconds = self.buffersize_msec
-        self._devconfig.pUserData = self._ffi_handle
-        self._devconfig.dataCallback = lib._internal_data_callback
-        self._devconfig.stopCallback = lib._internal_stop_callback
         self._devconfig.periods = callback_periods
+        self._setup_callbacks()
         self.callback_generator = None   # type: Optional[PlaybackCallbackGeneratorType]
 
         self._context = self._make_context(backends or [], thread_prio, app_name)
@@ -1453,6 +1785,11 @@ class PlaybackDevice(AbstractDevice):
         The generator should already be started before passing it in."""
         return super().start(callback_generator, stop_callback)
 
+    def _setup_callbacks(self) -> None:
+        self._devconfig.pUserData = self._ffi_handle
+        self._devconfig.dataCallback = lib._internal_data_callback
+        self._devconfig.stopCallback = lib._internal_stop_callback
+
     def _data_callback(self, device: ffi.CData, output: ffi.CData, input: ffi.CData, framecount: int) -> None:
         if self.callback_generator:
             try:
@@ -1471,15 +1808,140 @@ class PlaybackDevice(AbstractDevice):
                 ffi.memmove(output, samples_bytes, len(samples_bytes))
 
 
+class PrefetchingPlaybackDevice(PlaybackDevice):
+    """
+    An audio device for playback, that plays from a buffer which is filled ahead of time by a background thread.
+    The audio thread itself doesn't run any Python code, so it can't be held up by slow decoding, file i/o
+    or waiting for the GIL. The callback generator works the same as with a regular PlaybackDevice,
+    but it is called from the background thread and asked for larger chunks at a time.
+    The prefetch buffer adds its size (prefetch_msec) to the playback latency.
+    """
+    def __init__(self, output_format: SampleFormat = SampleFormat.SIGNED16, nchannels: int = 2,
+                 sample_rate: int = 44100, buffersize_msec: int = 200, device_id: Union[ffi.CData, None] = None,
+                 callback_periods: int = 0, backends: Optional[List[Backend]] = None,
+                 thread_prio: ThreadPriority = ThreadPriority.HIGHEST, app_name: str = "",
+                 prefetch_msec: int = 500) -> None:
+        self._prefetch = None
+        self._prefetch_frames = max(sample_rate * prefetch_msec // 1000, 256)
+        self._prefetch_wait = prefetch_msec / 4000
+        self._producer = None       # type: Optional[threading.Thread]
+        self._max_chunk_frames = 16384  # the maximum number of frames requested from the generator at once
+        super().__init__(output_format, nchannels, sample_rate, buffersize_msec, device_id,
+                         callback_periods, backends, thread_prio, app_name)
+
+    def _setup_callbacks(self) -> None:
+        self._prefetch = lib.pyma_prefetch_init(self.format.value, self.nchannels,
+                                                self._prefetch_frames, self._ffi_handle)
+        if not self._prefetch:
+            raise MiniaudioError("cannot create prefetch buffer")
+        self._devconfig.pUserData = self._prefetch
+        self._devconfig.dataCallback = lib.pyma_prefetch_data_callback
+        self._devconfig.stopCallback = lib._internal_prefetch_stop_callback
+
+    def start(self, callback_generator: PlaybackCallbackGeneratorType,      # type: ignore
+              stop_callback: Union[Callable, None] = None) -> None:
+        """Start the audio device: playback begins. The audio data is provided by the given callback generator,
+        which is driven from a background thread that keeps the prefetch buffer filled.
+        The generator gets sent the required number of frames and should yield the sample data
+        as raw bytes, a memoryview, an array.array, or as a numpy array with shape (numframes, numchannels).
+        The generator should already be started before passing it in."""
+        if self.callback_generator:
+            raise MiniaudioError("can't start an already started device")
+        if not inspect.isgenerator(callback_generator):
+            raise TypeError("callback must be a generator", type(callback_generator))
+        lib.pyma_prefetch_reset(self._prefetch)
+        try:
+            self._fill_buffer(callback_generator)      # avoid starting with an underrun
+            super().start(callback_generator, stop_callback)
+            producer = threading.Thread(target=self._producer_thread, args=(callback_generator,),
+                                        name="miniaudio-prefetch", daemon=True)
+            producer.start()
+            self._producer = producer
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self) -> None:
+        """Halt playback."""
+        self.callback_generator = None
+        if self._producer and self._producer is not threading.current_thread():
+            self._producer.join()
+        self._producer = None
+        super().stop()
+
+    def close(self) -> None:
+        """
+        Halt playback and close down the device.
+        If you use the device as a context manager, it will be closed automatically.
+        """
+        super().close()
+        if self._prefetch:
+            lib.pyma_prefetch_uninit(self._prefetch)
+            self._prefetch = None
+
+    def _fill_buffer(self, generator: PlaybackCallbackGeneratorType) -> bool:
+        # Fills the prefetch buffer from the generator. Returns False once the generator is exhausted.
+        # The frames are requested in chunks, because the stream functions can't produce more than
+        # 16384 frames per call.
+        frame_size = self.sample_width * self.nchannels
+        num_frames = min(lib.pyma_prefetch_available_write(self._prefetch), self._max_chunk_frames)
+        while num_frames > 0:
+            try:
+                samples = generator.send(num_frames)
+            except StopIteration:
+                return False
+            samples_bytes = _bytes_from_generator_samples(samples)
+            if not samples_bytes:
+                return True
+            if len(samples_bytes) > num_frames * frame_size:
+                raise MiniaudioError("number of frames from callback exceeds maximum")
+            lib.pyma_prefetch_write(self._prefetch, ffi.from_buffer(samples_bytes), len(samples_bytes) // frame_size)
+            num_frames = min(lib.pyma_prefetch_available_write(self._prefetch), self._max_chunk_frames)
+        return True
+
+    def _producer_thread(self, generator: PlaybackCallbackGeneratorType) -> None:
+        # the generator is passed in, so stop() clearing self.callback_generator can't interfere with it
+        min_frames = self._prefetch_frames // 4
+        while self.callback_generator is generator:
+            if lib.pyma_prefetch_available_write(self._prefetch) >= min_frames:
+                try:
+                    if not self._fill_buffer(generator):
+                        break
+                except Exception:
+                    if self.callback_generator is generator:
+                        self.callback_generator = None
+                    raise
+            time.sleep(self._prefetch_wait)
+        if self.callback_generator is generator:
+            self.callback_generator = None
+
+
+@ffi.def_extern()
+def _internal_prefetch_stop_callback(device: ffi.CData) -> None:
+    if not device.pUserData:
+        return
+    handle = lib.pyma_prefetch_get_userdata(ffi.cast("pyma_prefetch *", device.pUserData))
+    callback_device = ffi.from_handle(handle)
+    callback_device._stop_callback(device)
+
+
 class DuplexStream(AbstractDevice):
-    """Joins a capture device and a playback device."""
+    """
+    Joins a capture device and a playback device.
+    With passthrough=True, the recorded audio is played back directly by a data callback in C,
+    without running any Python code in the audio thread. Start it with start_passthrough() then.
+    """
     def __init__(self, playback_format: SampleFormat = SampleFormat.SIGNED16,
                  playback_channels: int = 2, capture_format: SampleFormat = SampleFormat.SIGNED16,
                  capture_channels: int = 2, sample_rate: int = 44100, buffersize_msec: int = 200,
                  playback_device_id: Union[ffi.CData, None] = None, capture_device_id: Union[ffi.CData, None] = None,
                  callback_periods: int = 0, backends: Optional[List[Backend]] = None,
-                 thread_prio: ThreadPriority = ThreadPriority.HIGHEST, app_name: str = "") -> None:
+                 thread_prio: ThreadPriority = ThreadPriority.HIGHEST, app_name: str = "",
+                 passthrough: bool = False) -> None:
         super().__init__()
+        if passthrough and capture_channels != playback_channels:
+            raise MiniaudioError("passthrough requires the same number of capture and playback channels")
+        self.passthrough = passthrough
         self.capture_format = capture_format
         self.playback_format = playback_format
         self.sample_width = _width_from_format(capture_format)
@@ -1498,7 +1960,11 @@ class DuplexStream(AbstractDevice):
         self._devconfig.capture.pDeviceID = capture_device_id or ffi.NULL
         self._devconfig.periodSizeInMilliseconds = self.buffersize_msec
         self._devconfig.pUserData = self._ffi_handle
-        self._devconfig.dataCallback = lib._internal_data_callback
+        if passthrough:
+            # the captured frames are converted directly into the playback buffer, only the format may differ
+            self._devconfig.dataCallback = lib.pyma_passthrough_data_callback
+        else:
+            self._devconfig.dataCallback = lib._internal_data_callback
         self._devconfig.stopCallback = lib._internal_stop_callback
         self._devconfig.periods = callback_periods
         self.callback_generator = None  # type: Optional[DuplexCallbackGeneratorType]
@@ -1517,8 +1983,23 @@ class DuplexStream(AbstractDevice):
         The audio data for playback is provided by the given callback generator, which is sent the
         recorded audio data at the same time.
         (it should already be started before passing it in)"""
+        if self.passthrough:
+            raise MiniaudioError("passthrough device must be started with start_passthrough()")
         return super().start(callback_generator, stop_callback)
 
+    def start_passthrough(self, stop_callback: Union[Callable, None] = None) -> None:
+        """Start the audio device that was created with passthrough=True: the recorded audio
+        is played back directly, without running any Python code in the audio thread."""
+        if not self.passthrough:
+            raise MiniaudioError("device was not created with passthrough=True")
+        if self.running:
+            raise MiniaudioError("can't start an already started device")
+        self.stop_callback = stop_callback
+        result = lib.ma_device_start(self._device)
+        if result != lib.MA_SUCCESS:
+            raise MiniaudioError("failed to start audio device", result)
+        self.running = True
+
     def _data_callback(self, device: ffi.CData, output: ffi.CData, input: ffi.CData, framecount: int) -> None:
         buffer_size = self.sample_width * self.capture_channels * framecount
         in_data = bytearray(buffer_size)
@@ -1544,6 +2025,8 @@ def _bytes_from_generator_samples(samples: Union[array.array, memoryview, bytes]
     elif isinstance(samples, memoryview) and samples.itemsize != 1:
         return samples.cast('B')    # type: ignore
     elif numpy and isinstance(samples, numpy.ndarray):
+        if samples.flags.c_contiguous:
+            return memoryview(samples).cast('B')    # type: ignore
         return samples.tobytes()
     return samples      # type: ignore
 
@@ -1561,22 +2044,20 @@ class WavFileReadStream(io.RawIOBase):
         self.max_bytes = (max_frames * nchannels * self.sample_width) or sys.maxsize
         self.bytes_done = 0
         # create WAVE header
-        fmt = ffi.new("drwav_data_format*")
-        fmt.container = lib.drwav_container_riff
-        fmt.format = lib.DR_WAVE_FORMAT_PCM
-        fmt.channels = nchannels
-        fmt.sampleRate = sample_rate
-        fmt.bitsPerSample = self.sample_width * 8
-        data = ffi.new("void**")
-        datasize = ffi.new("size_t *")
-        pwav = ffi.new("drwav*")
-        if max_frames > 0:
-            lib.drwav_init_memory_write_sequential(pwav, data, datasize, fmt, max_frames * nchannels, ffi.NULL)
-        else:
-            lib.drwav_init_memory_write(pwav, data, datasize, fmt, ffi.NULL)
-        lib.drwav_uninit(pwav)
-        self.buffered = bytes(ffi.buffer(data[0], datasize[0]))
-        lib.drwav_free(data[0], ffi.NULL)
+        with ffi.new("drwav_data_format*") as fmt, ffi.new("void**") as data, \
+                ffi.new("size_t *") as datasize, _new_uncleared("drwav *") as pwav:
+            fmt.container = lib.drwav_container_riff
+            fmt.format = lib.DR_WAVE_FORMAT_PCM
+            fmt.channels = nchannels
+            fmt.sampleRate = sample_rate
+            fmt.bitsPerSample = self.sample_width * 8
+            if max_frames > 0:
+                lib.drwav_init_memory_write_sequential(pwav, data, datasize, fmt, max_frames * nchannels, ffi.NULL)
+            else:
+                lib.drwav_init_memory_write(pwav, data, datasize, fmt, ffi.NULL)
+            lib.drwav_uninit(pwav)
+            self.buffered = bytes(ffi.buffer(data[0], datasize[0]))
+            lib.drwav_free(data[0], ffi.NULL)
 
     def read(self, amount: int = sys.maxsize) -> Optional[bytes]:
         """Read up to the given amount of bytes from the file."""
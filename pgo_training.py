@@ -0,0 +1,31 @@
+"""
+Training workload for a profile guided optimized build of the _miniaudio module.
+Run this with a module that was built with PYMINIAUDIO_PGO=generate, then rebuild with PYMINIAUDIO_PGO=use.
+"""
+
+import os
+import miniaudio
+
+
+def samples_path(filename):
+    return os.path.join(os.path.abspath(os.path.dirname(__file__)), "examples", "samples", filename)
+
+
+def train():
+    for name in ["music.wav", "music.flac", "music.mp3", "music.ogg"]:
+        filename = samples_path(name)
+        for sample_format in [miniaudio.SampleFormat.SIGNED16, miniaudio.SampleFormat.FLOAT32]:
+            decoded = miniaudio.decode_file(filename, output_format=sample_format)
+            frames = decoded.samples.tobytes()
+            miniaudio.convert_frames(sample_format, decoded.nchannels, decoded.sample_rate, frames,
+                                     miniaudio.SampleFormat.SIGNED16, 2, 48000)
+            miniaudio.convert_frames(sample_format, decoded.nchannels, decoded.sample_rate, frames,
+                                     miniaudio.SampleFormat.FLOAT32, 1, 22050)
+            miniaudio.calculate_levels(sample_format, frames)
+        for _ in miniaudio.stream_file(filename, output_format=miniaudio.SampleFormat.SIGNED16, nchannels=2,
+                                       sample_rate=44100, frames_to_read=1024):
+            pass
+
+
+if __name__ == "__main__":
+    train()
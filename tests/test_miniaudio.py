@@ -1,3 +1,6 @@
+import array
+import time
+import pytest
 import miniaudio
 from unittest import mock
 
@@ -75,6 +78,37 @@ def test_stop_callback_duplex(backends):
         assert duplex.running is False
 
 
+def test_duplex_passthrough(backends):
+    with pytest.raises(miniaudio.MiniaudioError, match="same number of capture and playback channels"):
+        miniaudio.DuplexStream(backends=backends, playback_channels=1, passthrough=True)
+    try:
+        duplex = miniaudio.DuplexStream(backends=backends, capture_format=miniaudio.SampleFormat.FLOAT32,
+                                        passthrough=True)
+    except miniaudio.MiniaudioError as me:
+        if me.args[0] != "failed to init device":
+            raise
+        else:
+            print("SKIPPING DUPLEX DEVICE INIT ERROR", me)
+    else:
+        with duplex:
+            passthrough_callback = miniaudio.ffi.addressof(miniaudio.lib, "pyma_passthrough_data_callback")
+            assert miniaudio.ffi.cast("void *", duplex._device.onData) == \
+                miniaudio.ffi.cast("void *", passthrough_callback)
+            gen = dummy_generator()
+            next(gen)
+            with pytest.raises(miniaudio.MiniaudioError):
+                duplex.start(gen)
+            duplex.start_passthrough()
+            assert duplex.running is True
+            time.sleep(0.1)
+            duplex.stop()
+            assert duplex.running is False
+        with miniaudio.DuplexStream(backends=backends) as duplex:
+            with pytest.raises(miniaudio.MiniaudioError, match="passthrough=True"):
+                duplex.start_passthrough()
+            assert duplex.running is False
+
+
 def test_cffi_api_calls_parameters_correct():
     import ast
     import inspect
@@ -280,3 +314,343 @@ def test_stream_any_flac(streamable_flac_source):
 
 def test_stream_any_vorbis(streamable_vorbis_source):
     miniaudio.stream_any(streamable_vorbis_source, miniaudio.FileFormat.VORBIS)
+
+
+def test_interleave_channels():
+    left = array.array('h', [1, 2, 3])
+    right = array.array('h', [-1, -2, -3])
+    frames = miniaudio.interleave_channels(miniaudio.SampleFormat.SIGNED16, [left, right])
+    assert array.array('h', frames) == array.array('h', [1, -1, 2, -2, 3, -3])
+    left = array.array('f', [0.5, 0.25])
+    right = array.array('f', [-0.5, -0.25])
+    frames = miniaudio.interleave_channels(miniaudio.SampleFormat.FLOAT32, [left, right])
+    assert array.array('f', frames) == array.array('f', [0.5, -0.5, 0.25, -0.25])
+    left, right = miniaudio.deinterleave_channels(miniaudio.SampleFormat.FLOAT32, 2, frames)
+    assert array.array('f', left) == array.array('f', [0.5, 0.25])
+    assert array.array('f', right) == array.array('f', [-0.5, -0.25])
+    frames = miniaudio.interleave_channels(miniaudio.SampleFormat.SIGNED16, [array.array('h', range(37))] * 2)
+    left, right = miniaudio.deinterleave_channels(miniaudio.SampleFormat.SIGNED16, 2, frames)
+    assert array.array('h', left) == array.array('h', right) == array.array('h', range(37))
+    chans = [array.array('h', [c, c + 10]) for c in range(6)]
+    frames = miniaudio.interleave_channels(miniaudio.SampleFormat.SIGNED16, chans)
+    assert array.array('h', frames) == array.array('h', [0, 1, 2, 3, 4, 5, 10, 11, 12, 13, 14, 15])
+    channels = miniaudio.deinterleave_channels(miniaudio.SampleFormat.SIGNED16, 6, frames)
+    assert [array.array('h', c) for c in channels] == chans
+
+
+def test_calculate_levels():
+    samples = array.array('f', [0.5, -0.5] * 5000 + [-0.75])
+    peak, rms = miniaudio.calculate_levels(miniaudio.SampleFormat.FLOAT32, samples)
+    assert peak == 0.75
+    assert rms == pytest.approx(((0.25 * 10000 + 0.5625) / 10001) ** 0.5)
+    samples = array.array('h', [16384, -16384, -32768])
+    peak, rms = miniaudio.calculate_levels(miniaudio.SampleFormat.SIGNED16, samples)
+    assert peak == 1.0
+    assert rms == pytest.approx(((0.25 + 0.25 + 1.0) / 3) ** 0.5)
+    assert miniaudio.calculate_levels(miniaudio.SampleFormat.FLOAT32, b"") == (0.0, 0.0)
+    with pytest.raises(miniaudio.MiniaudioError):
+        miniaudio.calculate_levels(miniaudio.SampleFormat.UNSIGNED8, b"\x80")
+
+
+def test_resample_f32():
+    ramp = array.array('f', [float(i) for i in range(100)])
+    up = miniaudio.resample_f32(ramp, 1, 100, 200)
+    assert len(up) == 200
+    assert list(up[:6]) == [0.0, 0.5, 1.0, 1.5, 2.0, 2.5]
+    stereo = miniaudio.interleave_channels(miniaudio.SampleFormat.FLOAT32, [ramp, array.array('f', [-x for x in ramp])])
+    for hermite in (False, True):
+        up = miniaudio.resample_f32(stereo, 2, 100, 200, hermite)
+        assert len(up) == 400
+        assert list(up[4:8]) == [1.0, -1.0, 1.5, -1.5]
+        assert list(up[100:104]) == [25.0, -25.0, 25.5, -25.5]
+        assert up[-2] == pytest.approx(99.0, abs=0.1)
+        mono = miniaudio.resample_f32(ramp, 1, 100, 200, hermite)
+        assert list(mono[2:198]) == list(up[4:396:2])
+    down = miniaudio.resample_f32(stereo, 2, 100, 50)
+    assert list(down[:6]) == [0.0, -0.0, 2.0, -2.0, 4.0, -4.0]
+
+
+def test_convert_sample_format_s16_f32():
+    samples = array.array('h', [0, 16384, -16384, 32767, -32768] * 7)
+    converted = miniaudio.convert_sample_format(miniaudio.SampleFormat.SIGNED16, samples.tobytes(),
+                                                miniaudio.SampleFormat.FLOAT32)
+    floats = array.array('f', converted)
+    assert list(floats[:5]) == [0.0, 0.5, -0.5, 32767 / 32768, -1.0]
+    floats[0] = 1.5     # must be clipped
+    converted = miniaudio.convert_sample_format(miniaudio.SampleFormat.FLOAT32, floats.tobytes(),
+                                                miniaudio.SampleFormat.SIGNED16)
+    assert list(array.array('h', converted)[:5]) == [32767, 16383, -16383, 32766, -32767]
+    for dither in (miniaudio.DitherMode.RECTANGLE, miniaudio.DitherMode.TRIANGLE):
+        floats = array.array('f', [0.0, 0.5, 1.0, -1.0] * 1001)
+        converted = array.array('h', miniaudio.convert_sample_format(miniaudio.SampleFormat.FLOAT32, floats,
+                                                                     miniaudio.SampleFormat.SIGNED16, dither))
+        assert len(converted) == len(floats)
+        assert set(converted[::4]) <= {-1, 0, 1}
+        assert len(set(converted[1::4])) > 1
+        assert set(converted[1::4]) <= {16382, 16383, 16384}
+        assert set(converted[2::4]) <= {32766, 32767}
+        assert set(converted[3::4]) <= {-32767, -32766}
+
+
+def test_convert_sample_format_into():
+    samples = array.array('h', [0, 16384, -16384, 32767, -32768])
+    floats = array.array('f', bytes(4 * 6))
+    assert miniaudio.convert_sample_format_into(miniaudio.SampleFormat.SIGNED16, samples,
+                                                miniaudio.SampleFormat.FLOAT32, floats) == 5
+    assert list(floats) == [0.0, 0.5, -0.5, 32767 / 32768, -1.0, 0.0]
+    unsigned = bytearray(5)
+    miniaudio.convert_sample_format_into(miniaudio.SampleFormat.SIGNED16, samples,
+                                         miniaudio.SampleFormat.UNSIGNED8, unsigned)
+    assert list(unsigned) == [128, 192, 64, 255, 0]
+    samples = array.array('h', range(-32768, 32768, 97))
+    unsigned = bytearray(len(samples))
+    miniaudio.convert_sample_format_into(miniaudio.SampleFormat.SIGNED16, samples,
+                                         miniaudio.SampleFormat.UNSIGNED8, unsigned)
+    assert list(unsigned) == [(s >> 8) + 128 for s in samples]
+    with pytest.raises(miniaudio.MiniaudioError):
+        miniaudio.convert_sample_format_into(miniaudio.SampleFormat.SIGNED16, samples,
+                                             miniaudio.SampleFormat.FLOAT32, bytearray(16))
+    with pytest.raises(miniaudio.MiniaudioError):
+        miniaudio.convert_sample_format_into(miniaudio.SampleFormat.SIGNED16, samples,
+                                             miniaudio.SampleFormat.FLOAT32, array.array('h', bytes(20)))
+
+
+def test_convert_frames_into():
+    stereo = array.array('h', [100, 300, -200, -400, 1000, 2000])
+    mono = array.array('h', bytes(2 * 3))
+    assert miniaudio.convert_frames_into(miniaudio.SampleFormat.SIGNED16, 2, 44100, stereo,
+                                         miniaudio.SampleFormat.SIGNED16, 1, 44100, mono) == 3
+    assert list(mono) == [200, -300, 1500]
+    expected = miniaudio.convert_frames(miniaudio.SampleFormat.SIGNED16, 2, 44100, stereo.tobytes(),
+                                        miniaudio.SampleFormat.FLOAT32, 2, 44100)
+    floats = array.array('f', bytes(len(expected)))
+    assert miniaudio.convert_frames_into(miniaudio.SampleFormat.SIGNED16, 2, 44100, stereo,
+                                         miniaudio.SampleFormat.FLOAT32, 2, 44100, floats) == 3
+    assert floats.tobytes() == expected
+
+
+def test_streamable_source_readinto():
+    class Source(miniaudio.StreamableSource):
+        def read(self, num_bytes):
+            return b"abc"[:num_bytes]
+
+    buffer = bytearray(5)
+    assert Source().readinto(memoryview(buffer)) == 3
+    assert buffer == b"abc\0\0"
+    buffer = bytearray(2)
+    assert Source().readinto(memoryview(buffer)) == 2
+    assert buffer == b"ab"
+
+
+def test_streamable_source_readinto_decoder():
+    class Source(miniaudio.StreamableSource):
+        def __init__(self):
+            self.file = open("examples/samples/music.wav", "rb")
+            self.buffer_types = set()
+
+        def read(self, num_bytes):
+            return self.file.read(num_bytes)
+
+        def readinto(self, buffer):
+            self.buffer_types.add(type(buffer))
+            return self.file.readinto(buffer)
+
+        def seek(self, offset, origin):
+            self.file.seek(offset, 1 if origin == miniaudio.SeekOrigin.CURRENT else 0)
+            return True
+
+        def close(self):
+            self.file.close()
+
+    with Source() as source:
+        stream = miniaudio.stream_any(source, miniaudio.FileFormat.WAV)
+        next(stream)
+        assert len(stream.send(1024)) == 2048
+        assert source.buffer_types == {memoryview}
+
+
+def test_decoder():
+    with miniaudio.Decoder("examples/samples/music.ogg", miniaudio.SampleFormat.SIGNED16, 2, 22050) as decoder:
+        samples = decoder.read(1000)
+        assert len(samples) == 2000
+        assert samples.typecode == 'h'
+        buffer = array.array('h', bytes(2 * 512 * 2))
+        assert decoder.read_into(buffer) == 512
+        decoder.seek(0)
+        assert decoder.read(1000) == samples
+    with miniaudio.Decoder(load_sample("music.wav"), miniaudio.SampleFormat.FLOAT32, 1, 22050) as decoder:
+        buffer = bytearray(4 * 300)
+        assert decoder.read_into(buffer) == 300
+        decoder.seek(decoder.num_frames - 10)
+        assert len(decoder.read(100)) == 10
+        assert len(decoder.read(100)) == 0
+    with miniaudio.Decoder("examples/samples/music.ogg", miniaudio.SampleFormat.SIGNED16, 2, 22050) as decoder:
+        planar = array.array('h', bytes(2 * 2 * 3000))
+        assert decoder.read_planar_into(planar) == 3000
+        left, right = miniaudio.deinterleave_channels(miniaudio.SampleFormat.SIGNED16, 2, samples)
+        assert planar[:1000] == array.array('h', left)
+        assert planar[3000:4000] == array.array('h', right)
+    with miniaudio.Decoder(load_sample("music.wav"), miniaudio.SampleFormat.FLOAT32, 1, 22050) as decoder:
+        decoder.seek(decoder.num_frames - 10)
+        buffer = array.array('f', bytes(4 * 100))
+        assert decoder.read_into(buffer, loop=True) == 100
+        decoder.seek(0)
+        assert decoder.read(90) == buffer[10:]
+
+
+def test_flush_denormals():
+    import platform
+    import threading
+    if platform.machine().lower() not in ("x86_64", "amd64", "aarch64", "arm64"):
+        pytest.skip("FTZ/DAZ only implemented on x86_64/aarch64")
+    results = []
+
+    def audio_thread():
+        tiny = 1e-310
+        results.append(tiny * 0.5)
+        miniaudio.lib.pyma_flush_denormals()
+        results.append(tiny * 0.5)
+
+    thread = threading.Thread(target=audio_thread)
+    thread.start()
+    thread.join()
+    assert results[0] > 0.0
+    assert results[1] == 0.0
+    assert 1e-310 * 0.5 > 0.0      # other threads are not affected
+
+
+def test_decode_mmap():
+    import mmap
+    with open("examples/samples/music.flac", "rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        assert miniaudio.flac_get_info(data).num_frames == 220854
+        decoded = miniaudio.decode(data, sample_rate=22050)
+        assert decoded.num_frames == 220854
+    with open("examples/samples/music.ogg", "rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        assert miniaudio.vorbis_get_info(data).sample_rate == 22050
+
+
+def test_bytes_from_numpy_samples():
+    numpy = pytest.importorskip("numpy")
+    samples = numpy.arange(12, dtype=numpy.int16).reshape(6, 2)
+    converted = miniaudio._bytes_from_generator_samples(samples)
+    assert isinstance(converted, memoryview)
+    assert converted == samples.tobytes()
+    assert miniaudio._bytes_from_generator_samples(samples[::2]) == samples[::2].tobytes()
+
+
+def test_as_numpy_array():
+    numpy = pytest.importorskip("numpy")
+    samples = array.array('h', range(12))
+    npa = miniaudio.as_numpy_array(samples, miniaudio.SampleFormat.SIGNED16, 2)
+    assert npa.shape == (6, 2)
+    assert npa.dtype == numpy.int16
+    assert npa[1, 1] == 3
+    buffer = bytearray(24)
+    pointer = miniaudio.ffi.cast("float *", miniaudio.ffi.from_buffer(buffer))
+    npa = miniaudio.as_numpy_array(pointer, miniaudio.SampleFormat.FLOAT32, 3, 2)
+    npa[1, 2] = 0.5
+    assert array.array('f', buffer)[5] == 0.5
+    with pytest.raises(miniaudio.MiniaudioError):
+        miniaudio.as_numpy_array(buffer, miniaudio.SampleFormat.SIGNED24, 2)
+
+
+def test_decoder_native_format():
+    with miniaudio.Decoder("examples/samples/music.flac", miniaudio.SampleFormat.UNKNOWN, 0, 0) as decoder:
+        assert decoder.output_format == miniaudio.SampleFormat.SIGNED16
+        assert decoder.nchannels == 2
+        assert decoder.sample_rate == 22050
+        assert len(decoder.read(100)) == 200
+    with miniaudio.Decoder("examples/samples/music.flac", miniaudio.SampleFormat.FLOAT32, 0, 44100) as decoder:
+        assert decoder.output_format == miniaudio.SampleFormat.FLOAT32
+        assert decoder.nchannels == 2
+        assert decoder.sample_rate == 44100
+
+
+def test_decoder_keeps_memory_source_alive():
+    data = bytearray(load_sample("music.flac"))
+    decoder = miniaudio.Decoder(data)
+    with pytest.raises(BufferError):
+        data.clear()    # the decoder still reads from this memory
+    assert len(decoder.read(1000)) == 2000
+    decoder.close()
+    data.clear()
+    data = bytearray(b"this is not audio data" * 100)
+    with pytest.raises(miniaudio.DecodeError):
+        miniaudio.Decoder(data)
+    data.clear()    # a decoder that failed to init has released the memory again
+    data = bytearray(load_sample("music.ogg"))
+    stream = miniaudio.stream_memory(data)
+    next(stream)
+    with pytest.raises(BufferError):
+        data.clear()
+    assert len(stream.send(1000)) == 2000
+
+
+def test_detect_format():
+    assert miniaudio._detect_format(load_sample("music.wav")) == miniaudio.FileFormat.WAV
+    assert miniaudio._detect_format(load_sample("music.flac")) == miniaudio.FileFormat.FLAC
+    assert miniaudio._detect_format(load_sample("music.ogg")) == miniaudio.FileFormat.VORBIS
+    assert miniaudio._detect_format(load_sample("music.mp3")) == miniaudio.FileFormat.MP3
+    assert miniaudio._detect_format(b"") == miniaudio.FileFormat.UNKNOWN
+    assert miniaudio._detect_format(b"\0\0\0\0\0") == miniaudio.FileFormat.UNKNOWN
+    for name in ("music.wav", "music.flac", "music.ogg", "music.mp3"):
+        stream = miniaudio.stream_memory(load_sample(name), sample_rate=22050)
+        assert len(next(stream)) == 2048
+
+
+def test_prefetching_playback(backends):
+    requested = []
+
+    def generator():
+        num_frames = yield b""
+        while True:
+            requested.append(num_frames)
+            num_frames = yield array.array('h', [0] * (num_frames * 2))
+
+    with miniaudio.PrefetchingPlaybackDevice(backends=backends, prefetch_msec=100) as playback:
+        gen = generator()
+        next(gen)
+        playback.start(gen)
+        assert playback.running is True
+        assert requested[0] == 4410     # the prefetch buffer is filled completely before playback starts
+        time.sleep(0.3)
+        playback.stop()
+        assert playback.running is False
+        assert len(requested) > 1
+        stop_callback = mock.Mock()
+        playback.start(gen, stop_callback)
+        miniaudio.lib.ma_device_stop(playback._device)
+        stop_callback.assert_called_once()
+        assert playback.running is False
+
+
+def test_prefetching_playback_stream_file(backends):
+    with miniaudio.PrefetchingPlaybackDevice(backends=backends) as playback:
+        stream = miniaudio.stream_file("examples/samples/music.wav")
+        next(stream)
+        playback.start(stream)      # the default prefetch buffer is larger than one stream chunk
+        assert playback.running is True
+        assert miniaudio.lib.pyma_prefetch_available_write(playback._prefetch) < 16384
+        time.sleep(0.2)
+        playback.stop()
+        assert playback.running is False
+
+
+def test_prefetching_playback_start_error(backends):
+    def failing_generator():
+        yield b""
+        raise ValueError("no audio")
+
+    with miniaudio.PrefetchingPlaybackDevice(backends=backends) as playback:
+        gen = failing_generator()
+        next(gen)
+        with pytest.raises(ValueError):
+            playback.start(gen)
+        assert playback.running is False
+        assert playback.callback_generator is None
+        gen = dummy_generator()
+        next(gen)
+        playback.start(gen)     # the device can still be started after the failure
+        assert playback.running is True